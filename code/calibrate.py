@@ -0,0 +1,119 @@
+"""Build the prediction-uncertainty tables served with every forecast.
+
+Scores the held-out 20% split (the notebook's, see retrain.split) with the
+pipelines in ``--model-dir``. It then bins delay residuals and cancellation
+outcomes by model set, carrier, origin airport type and departure hour
+(see shiny-py/uncertainty.py) and writes ``uncertainty.npz`` next to the
+pickles. Half of the held-out rows are first used to check the interval
+coverage and calibration on the other half; the saved tables use all of it.
+
+    python calibrate.py combined.csv --model-dir ../shiny-py/model
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import joblib
+import numpy as np
+from sklearn.metrics import brier_score_loss
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "shiny-py"))
+from model_registry import MODEL_DIR, MODEL_FILES, ModelRegistry  # noqa: E402
+from uncertainty import COVERAGE, KEYS, TABLES_FILE, UncertaintyTables  # noqa: E402
+
+from retrain import add_training_features, delay_frame, load_flights, split  # noqa: E402
+
+
+def held_out_predictions(df, model_dir=MODEL_DIR):
+    """{model_set: {"delays": frame, "cancel": frame}} of held-out rows with predictions."""
+    df = add_training_features(df)
+    delays = delay_frame(df)
+    held_out = {}
+    for model_set, files in MODEL_FILES.items():
+        pipelines = {name: joblib.load(Path(model_dir) / fname) for name, fname in files.items()}
+        features = {name: list(p.feature_names_in_) for name, p in pipelines.items()}
+        if any(c not in df for cols in features.values() for c in cols):
+            print(f"{model_set}: features missing from data, skipped")
+            continue
+        _, cancel = split(df, "cancel")
+        cancel = cancel[KEYS + ["CANCELLED"]].assign(
+            CANCEL_PROB=pipelines["cancel"].predict_proba(cancel[features["cancel"]])[:, 1])
+        # dep and arr share one split of the delay frame
+        _, test = split(delays, "dep")
+        test = test[KEYS + ["DEP_DELAY", "ARR_DELAY"]].assign(
+            DEP_DELAY_PRED=pipelines["dep"].predict(test[features["dep"]]),
+            ARR_DELAY_PRED=pipelines["arr"].predict(test[features["arr"]]),
+        )
+        held_out[model_set] = {"delays": test, "cancel": cancel}
+        print(f"{model_set}: {len(test)} delay and {len(cancel)} cancellation rows held out")
+    return held_out
+
+
+def _halves(held_out, seed=0):
+    rng = np.random.default_rng(seed)
+    first, second = {}, {}
+    for model_set, parts in held_out.items():
+        first[model_set], second[model_set] = {}, {}
+        for name, frame in parts.items():
+            mask = rng.random(len(frame)) < 0.5
+            first[model_set][name], second[model_set][name] = frame[mask], frame[~mask]
+    return first, second
+
+
+def check(tables, held_out):
+    """Interval coverage and Brier scores of ``tables`` on other held-out rows."""
+    report = {}
+    for model_set, parts in held_out.items():
+        delays, cancel = parts["delays"], parts["cancel"]
+        out = tables.apply(model_set, delays, {
+            "dep_delay": delays["DEP_DELAY_PRED"], "arr_delay": delays["ARR_DELAY_PRED"],
+            "cancel_prob": np.zeros(len(delays)),
+        })
+        calibrated = tables.apply(model_set, cancel, {
+            "dep_delay": np.zeros(len(cancel)), "arr_delay": np.zeros(len(cancel)),
+            "cancel_prob": cancel["CANCEL_PROB"],
+        })["CANCEL_PROB_CALIBRATED"]
+        entry = {}
+        for side in ("DEP", "ARR"):
+            actual = delays[f"{side}_DELAY"].to_numpy()
+            inside = (actual >= out[f"{side}_DELAY_LO"]) & (actual <= out[f"{side}_DELAY_HI"])
+            entry[f"{side.lower()}_coverage"] = float(np.mean(inside))
+            entry[f"{side.lower()}_width"] = float(np.nanmedian(out[f"{side}_DELAY_HI"] - out[f"{side}_DELAY_LO"]))
+        known = ~np.isnan(calibrated)
+        entry["brier_raw"] = float(brier_score_loss(cancel["CANCELLED"], cancel["CANCEL_PROB"]))
+        entry["brier_calibrated"] = float(brier_score_loss(cancel["CANCELLED"][known], calibrated[known]))
+        report[model_set] = entry
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build uncertainty tables from held-out predictions.")
+    parser.add_argument("data", help="training CSV/Parquet (e.g. combined.csv) or ingest.py dataset")
+    parser.add_argument("--months", type=int, nargs="*")
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    parser.add_argument("--output", default=None, help=f"default: <model-dir>/{TABLES_FILE}")
+    args = parser.parse_args(argv)
+
+    start = time.time()
+    held_out = held_out_predictions(load_flights(args.data, args.months), args.model_dir)
+    if not held_out:
+        sys.exit("No model set could be scored on this data")
+    # The version the serving registry reports for these models
+    version = ModelRegistry(args.model_dir).version
+
+    first, second = _halves(held_out)
+    for model_set, entry in check(UncertaintyTables.build(first, version), second).items():
+        print(f"  {model_set:<11} {COVERAGE:.0%} interval coverage dep {entry['dep_coverage']:.3f} "
+              f"(median width {entry['dep_width']:.1f} min), arr {entry['arr_coverage']:.3f} "
+              f"(median width {entry['arr_width']:.1f} min); cancel Brier "
+              f"{entry['brier_raw']:.4f} -> {entry['brier_calibrated']:.4f}")
+
+    tables = UncertaintyTables.build(held_out, version)
+    output = args.output or Path(args.model_dir) / TABLES_FILE
+    tables.save(output)
+    print(f"Wrote {output} ({Path(output).stat().st_size / 1024:.0f} KiB) in {time.time() - start:.0f}s")
+
+
+if __name__ == "__main__":
+    main()
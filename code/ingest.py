@@ -0,0 +1,160 @@
+"""Streaming ingestion of raw BTS monthly files into a partitioned Parquet dataset.
+
+Each raw CSV is read in fixed-size chunks; every chunk goes through the
+preprocess.py recode/join/UTC steps plus the training features and is
+appended to a hive-partitioned dataset (YEAR=/MONTH=/MKT_AIRLINE=) with
+compact dtypes. Memory use is bounded by the chunk size, not by how many
+months are ingested.
+
+    python ingest.py May2024.csv Jun2024.csv ... flights_parquet/
+
+Training and analysis code then reads only what it needs:
+
+    read_flights("flights_parquet", columns=["ORIGIN_IATA", "DEP_DELAY"],
+                 filters=[("MONTH", "in", [5, 6])])
+"""
+import argparse
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from preprocess import add_utc_times, load_airports, recode
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "shiny-py"))
+from calendar_features import calendar_features, hour_of  # noqa: E402
+
+PARTITION_COLUMNS = ["YEAR", "MONTH", "MKT_AIRLINE"]
+
+CATEGORICAL = [
+    "WEEK", "ORIGIN_IATA", "DEST_IATA", "ORIGIN_CITY", "DEST_CITY", "ORIGIN_STATE_ABR", "DEST_STATE_ABR",
+    "CANCELLATION_CODE", "ORIGIN_TYPE", "DEST_TYPE", "ORIGIN_TZ", "DEST_TZ",
+]
+
+# hhmm clock times and minute counts all fit in int16; nullable where BTS leaves
+# blanks (an hour from a blank time stays missing), plain ints for flags that default to 0
+SMALL_INTS = {
+    "YEAR": "int16", "MONTH": "int8", "DAY": "int8", "DEP_HOUR": "Int8", "ARR_HOUR": "Int8",
+    "IS_WEEKEND": "int8", "IS_HOLIDAY": "int8", "HOLIDAY_WINDOW": "int8", "CANCELLED": "int8", "DIVERTED": "int8",
+    "SCH_DEP_TIME": "Int16", "SCH_ARR_TIME": "Int16", "ACT_DEP_TIME": "Int16", "ACT_ARR_TIME": "Int16",
+    "SCH_DURATION": "Int16", "ACT_DURATION": "Int16", "ORIGIN_ELEV": "Int16", "DEST_ELEV": "Int16",
+    "MKT_FL_NUM": "Int16", "DISTANCE": "Int16",
+}
+
+
+def add_features(data):
+    """Calendar/hour features the models use, from the shared calendar table."""
+    data["DATE"] = pd.to_datetime(pd.DataFrame({"year": data["YEAR"], "month": data["MONTH"], "day": data["DAY"]}))
+    calendar = calendar_features(data["DATE"])
+    for col in ("IS_WEEKEND", "IS_HOLIDAY", "HOLIDAY_WINDOW"):
+        data[col] = calendar[col]
+    data["DEP_HOUR"] = hour_of(pd.to_numeric(data["SCH_DEP_TIME"], errors="coerce"))
+    data["ARR_HOUR"] = hour_of(pd.to_numeric(data["SCH_ARR_TIME"], errors="coerce"))
+    return data
+
+
+def compact(data):
+    """Downcast to categoricals, small ints and float32."""
+    for col, dtype in SMALL_INTS.items():
+        if col in data:
+            values = pd.to_numeric(data[col], errors="coerce")
+            if dtype[0] == "I":
+                values = values.round().astype(dtype)
+            else:
+                values = values.fillna(0).astype(dtype)
+            data[col] = values
+    for col in CATEGORICAL:
+        if col in data:
+            data[col] = data[col].astype("category")
+    for col in data.columns:
+        if data[col].dtype == np.float64:
+            data[col] = data[col].astype(np.float32)
+    return data
+
+
+def process_chunk(raw, ourairports, airport_tz):
+    data = recode(raw)
+    # Only the airport fields the models use, so there are no .x/.y duplicates
+    for side in ("ORIGIN", "DEST"):
+        data = data.merge(
+            ourairports[["iata_code", "type", "elevation_ft"]].rename(columns={
+                "iata_code": f"{side}_IATA", "type": f"{side}_TYPE", "elevation_ft": f"{side}_ELEV",
+            }),
+            on=f"{side}_IATA", how="left",
+        )
+        data = data.merge(
+            airport_tz.rename(columns={"iata_code": f"{side}_IATA", "iana_tz": f"{side}_TZ"}),
+            on=f"{side}_IATA", how="left",
+        )
+    data = add_utc_times(data)
+    data = data.drop(columns=[c for c in data.columns if c.startswith("Unnamed")] + ["FL_DATE"], errors="ignore")
+    return compact(add_features(data))
+
+
+def write_chunk(data, out_dir):
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    pq.write_to_dataset(
+        table,
+        root_path=str(out_dir),
+        partition_cols=PARTITION_COLUMNS,
+        # unique per chunk so later chunks and months append instead of overwrite
+        basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+
+
+def ingest(raw_paths, out_dir, ourairports, airport_tz, chunksize=250_000):
+    """Stream every raw file into ``out_dir``; returns the number of rows written."""
+    out_dir = Path(out_dir)
+    total = 0
+    for path in raw_paths:
+        start = time.time()
+        rows = 0
+        for raw in pd.read_csv(path, chunksize=chunksize, low_memory=False):
+            data = process_chunk(raw, ourairports, airport_tz)
+            if len(data):
+                write_chunk(data, out_dir)
+            rows += len(data)
+        print(f"{path}: {rows} rows in {time.time() - start:.1f}s")
+        total += rows
+    return total
+
+
+def read_flights(path, columns=None, filters=None):
+    """Load selected columns/partitions of an ingested dataset as a DataFrame.
+
+    ``filters`` uses pyarrow's DNF form, e.g. ``[("MKT_AIRLINE", "=", "AA")]``;
+    partition filters skip whole directories without opening them.
+    """
+    dataset = ds.dataset(str(path), format="parquet", partitioning="hive")
+    expression = pq.filters_to_expression(filters) if filters else None
+    data = dataset.to_table(columns=columns, filter=expression).to_pandas()
+    # Partition keys come back as plain int32/str columns
+    for col in PARTITION_COLUMNS:
+        if col in data:
+            data[col] = data[col].astype("category" if col == "MKT_AIRLINE" else SMALL_INTS[col])
+    return data
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest raw BTS monthly CSVs into a partitioned Parquet dataset.")
+    parser.add_argument("raw", nargs="+", help="raw BTS CSV files")
+    parser.add_argument("output", help="dataset directory (created or appended to)")
+    parser.add_argument("--airports", default="our_airports_info.csv")
+    parser.add_argument("--timezones", default="airport_timezone.csv")
+    parser.add_argument("--chunksize", type=int, default=250_000, help="rows per chunk")
+    args = parser.parse_args(argv)
+
+    ourairports, airport_tz = load_airports(args.airports, args.timezones)
+    total = ingest(args.raw, args.output, ourairports, airport_tz, chunksize=args.chunksize)
+    print(f"Wrote {total} rows to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
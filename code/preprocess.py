@@ -0,0 +1,152 @@
+"""Vectorized Python port of preprocess.R.
+
+Recodes weekday and cancellation codes, renames the BTS columns, joins
+airport type/elevation and IANA timezones for origin and destination, and
+converts scheduled/actual departure and arrival times to UTC. The UTC step
+localizes each timezone's rows in one call instead of looping row by row.
+
+One deliberate difference from the R script: the airport and timezone
+tables are deduplicated by IATA code before joining. preprocess.R joins
+them as they are, so an IATA code listed twice in ourairports repeats
+every flight to or from that airport. The output here can therefore have
+fewer rows than the R output (never more); the number of duplicated codes
+is printed.
+
+    python preprocess.py May2024.csv sample_data.csv
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+WEEKDAYS = {1: "Mon", 2: "Tue", 3: "Wed", 4: "Thu", 5: "Fri", 6: "Sat", 7: "Sun"}
+
+CANCELLATION_CODES = {"A": "Carrier", "B": "Weather", "C": "NAS", "D": "Security"}
+
+RENAMES = {
+    "DAY_OF_MONTH": "DAY", "DAY_OF_WEEK": "WEEK", "FL_DATE": "DATE",
+    "ORIGIN": "ORIGIN_IATA", "ORIGIN_CITY_NAME": "ORIGIN_CITY",
+    "DEST": "DEST_IATA", "DEST_CITY_NAME": "DEST_CITY",
+    "MKT_UNIQUE_CARRIER": "MKT_AIRLINE", "MKT_CARRIER_FL_NUM": "MKT_FL_NUM",
+    "CRS_DEP_TIME": "SCH_DEP_TIME", "DEP_TIME": "ACT_DEP_TIME",
+    "CRS_ARR_TIME": "SCH_ARR_TIME", "ARR_TIME": "ACT_ARR_TIME",
+    "CRS_ELAPSED_TIME": "SCH_DURATION", "ACTUAL_ELAPSED_TIME": "ACT_DURATION",
+}
+
+
+def recode(raw):
+    """Weekday/cancellation recodes and BTS -> project column names."""
+    data = raw.copy()
+    # 9 means "unknown" in BTS and is dropped, as in the R script
+    data["DAY_OF_WEEK"] = data["DAY_OF_WEEK"].map(WEEKDAYS)
+    data = data[data["DAY_OF_WEEK"].notna()]
+    data["CANCELLATION_CODE"] = data["CANCELLATION_CODE"].map(CANCELLATION_CODES)
+    return data.rename(columns=RENAMES)
+
+
+def load_airports(ourairports_csv, timezone_csv):
+    ourairports = pd.read_csv(ourairports_csv, low_memory=False)
+    ourairports = ourairports[ourairports["iata_code"].notna()]
+    airport_tz = pd.read_csv(timezone_csv)[["iata_code", "iana_tz"]]
+    # Unlike preprocess.R, which would repeat those airports' flights
+    for name, table in (("ourairports", ourairports), ("timezone", airport_tz)):
+        duplicated = table["iata_code"].duplicated().sum()
+        if duplicated:
+            print(f"Dropped {duplicated} duplicated IATA codes from the {name} table (kept the first)")
+    ourairports = ourairports.drop_duplicates("iata_code")
+    airport_tz = airport_tz.drop_duplicates("iata_code")
+    return ourairports, airport_tz
+
+
+def join_airports(data, ourairports, airport_tz):
+    """Attach airport info and timezone for both ends (dplyr-style .x/.y suffixes)."""
+    for side in ("ORIGIN", "DEST"):
+        info = ourairports.rename(columns={
+            "type": f"{side}_TYPE", "elevation_ft": f"{side}_ELEV", "iata_code": f"{side}_IATA",
+        })
+        tz = airport_tz.rename(columns={"iata_code": f"{side}_IATA", "iana_tz": f"{side}_TZ"})
+        data = data.merge(info, on=f"{side}_IATA", how="left", suffixes=(".x", ".y"))
+        data = data.merge(tz, on=f"{side}_IATA", how="left")
+    return data
+
+
+def local_to_utc(local, tz):
+    """Convert naive local timestamps to naive UTC, one localize per timezone.
+
+    Rows with a missing or unknown timezone come out as NaT.
+    """
+    out = pd.Series(pd.NaT, index=local.index, dtype="datetime64[ns]")
+    for zone, idx in local.groupby(tz, sort=False).groups.items():
+        # Like lubridate's defaults: repeated fall-back times take the first
+        # (DST) offset, skipped spring-forward times roll to the boundary
+        try:
+            converted = (
+                pd.DatetimeIndex(local.loc[idx])
+                .tz_localize(zone, ambiguous=np.ones(len(idx), dtype=bool), nonexistent="shift_forward")
+                .tz_convert("UTC")
+                .tz_localize(None)
+            )
+        except KeyError:
+            # pytz and zoneinfo both raise KeyError subclasses for unknown names
+            print(f"Unknown timezone {zone!r}: left {len(idx)} UTC times empty")
+            continue
+        out.loc[idx] = converted
+    return out
+
+
+def _hhmm_to_offset(hhmm):
+    # BTS stores times as hhmm numbers (e.g. 530 for 05:30); 2400 is midnight
+    hhmm = pd.to_numeric(hhmm, errors="coerce")
+    return pd.to_timedelta(hhmm // 100 * 60 + hhmm % 100, unit="min")
+
+
+def add_utc_times(data):
+    """SCH/ACT_DEP/ARR_TIME_UTC from local schedule, duration and delays."""
+    day = pd.to_datetime(pd.DataFrame({"year": data["YEAR"], "month": data["MONTH"], "day": data["DAY"]}))
+    sch_dep_local = day + _hhmm_to_offset(data["SCH_DEP_TIME"])
+    sch_dep_utc = local_to_utc(sch_dep_local, data["ORIGIN_TZ"])
+    sch_arr_utc = sch_dep_utc + pd.to_timedelta(pd.to_numeric(data["SCH_DURATION"], errors="coerce"), unit="min")
+    act_dep_utc = sch_dep_utc + pd.to_timedelta(pd.to_numeric(data["DEP_DELAY"], errors="coerce"), unit="min")
+    act_arr_utc = sch_arr_utc + pd.to_timedelta(pd.to_numeric(data["ARR_DELAY"], errors="coerce"), unit="min")
+    return data.assign(
+        SCH_DEP_TIME_UTC=sch_dep_utc,
+        ACT_DEP_TIME_UTC=act_dep_utc,
+        SCH_ARR_TIME_UTC=sch_arr_utc,
+        ACT_ARR_TIME_UTC=act_arr_utc,
+    )
+
+
+def preprocess(raw, ourairports, airport_tz):
+    return add_utc_times(join_airports(recode(raw), ourairports, airport_tz))
+
+
+def write_csv(data, path):
+    # Same timestamp layout as R's write.csv of a UTC POSIXct column
+    data = data.copy()
+    for col in ("SCH_DEP_TIME_UTC", "ACT_DEP_TIME_UTC", "SCH_ARR_TIME_UTC", "ACT_ARR_TIME_UTC"):
+        data[col] = data[col].dt.strftime("%Y-%m-%d %H:%M:%S")
+    data.to_csv(path, index=False, na_rep="NA")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Preprocess a raw BTS monthly file (port of preprocess.R).")
+    parser.add_argument("raw", nargs="?", default="May2024.csv")
+    parser.add_argument("output", nargs="?", default="sample_data.csv")
+    parser.add_argument("--airports", default="our_airports_info.csv")
+    parser.add_argument("--timezones", default="airport_timezone.csv")
+    parser.add_argument("--limit", type=int, default=None, help="only process the first N rows")
+    args = parser.parse_args(argv)
+
+    start = time.time()
+    raw = pd.read_csv(args.raw, nrows=args.limit, low_memory=False)
+    ourairports, airport_tz = load_airports(args.airports, args.timezones)
+    data = preprocess(raw, ourairports, airport_tz)
+    write_csv(data, args.output)
+    missing_tz = int(np.sum(data["SCH_DEP_TIME_UTC"].isna()))
+    print(f"Wrote {len(data)} rows to {args.output} in {time.time() - start:.1f}s "
+          f"({missing_tz} without a scheduled UTC departure)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""Incrementally refresh the six pipe_* models from newly ingested months.
+
+Instead of refitting from the full history, each pipeline is continued:
+the TargetEncoder tables are recomputed from running per-category
+count/sum statistics (kept next to the models in te_stats.json), and the
+XGBoost model gets ``--rounds`` extra trees boosted from the existing
+booster via ``xgb_model=``. The result is written as a new versioned model
+directory together with report.json comparing it with the previous
+version on a holdout from the new data.
+
+    python retrain.py flights_parquet --months 9 --previous ../shiny-py/model --output model_versions
+
+Point the app at the new directory with MODEL_DIR (or ModelRegistry.swap).
+"""
+import argparse
+import copy
+import json
+import shutil
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.metrics import log_loss, mean_absolute_error, mean_squared_error, roc_auc_score
+from sklearn.model_selection import train_test_split
+from sklearn.pipeline import Pipeline
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "shiny-py"))
+from calendar_features import calendar_features, hour_of  # noqa: E402
+from model_registry import MODEL_DIR, MODEL_FILES  # noqa: E402
+
+from ingest import read_flights  # noqa: E402
+
+TE_STATS_FILE = "te_stats.json"
+
+# Which target drives each model's TargetEncoder statistics. The notebook
+# fits one preprocessor object for dep and arr, so both carry the
+# ARR_DELAY-fitted encoding; keep it that way.
+ENCODER_TARGETS = {"cancel": "CANCELLED", "dep": "ARR_DELAY", "arr": "ARR_DELAY"}
+MODEL_TARGETS = {"cancel": "CANCELLED", "dep": "DEP_DELAY", "arr": "ARR_DELAY"}
+
+
+def load_flights(path, months=None):
+    """Read an ingest.py dataset directory (optionally some months) or a CSV/Parquet file.
+
+    Columns come back with plain numpy dtypes, whatever the source, so the
+    sklearn/XGBoost pipelines see the same input as from a CSV.
+    """
+    path = Path(path)
+    if path.is_dir():
+        filters = [("MONTH", "in", list(months))] if months else None
+        return plain_dtypes(read_flights(path, filters=filters))
+    df = pd.read_parquet(path) if path.suffix == ".parquet" else pd.read_csv(path)
+    if months:
+        df = df[pd.to_datetime(df["DATE"]).dt.month.isin(months)]
+    return plain_dtypes(df)
+
+
+def plain_dtypes(df):
+    """Nullable ints (ingest.py's Int8/Int16 with pd.NA) to float32 with NaN, categoricals to object."""
+    for col in df.columns:
+        dtype = df[col].dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(object).where(df[col].notna(), np.nan)
+        elif pd.api.types.is_extension_array_dtype(dtype) and pd.api.types.is_numeric_dtype(dtype):
+            df[col] = df[col].astype("float32")
+    return df
+
+
+def add_training_features(df):
+    """The notebook's derived features, for inputs that do not have them yet."""
+    df = df.copy()
+    if "IS_WEEKEND" not in df or "IS_HOLIDAY" not in df:
+        calendar = calendar_features(df["DATE"])
+        df["IS_WEEKEND"] = calendar["IS_WEEKEND"]
+        df["IS_HOLIDAY"] = calendar["IS_HOLIDAY"]
+    if "DEP_HOUR" not in df:
+        df["DEP_HOUR"] = hour_of(df["SCH_DEP_TIME"])
+    if "ARR_HOUR" not in df:
+        df["ARR_HOUR"] = hour_of(df["SCH_ARR_TIME"])
+    return df
+
+
+def _outlier_index(data):
+    q1, q3 = data.quantile(0.25), data.quantile(0.75)
+    iqr = q3 - q1
+    return data[(data < q1 - 1.5 * iqr) | (data > q3 + 1.5 * iqr)].index
+
+
+def delay_frame(df):
+    """Rows the delay models train on: both delays known, IQR outliers removed."""
+    df = df.dropna(subset=["DEP_DELAY", "ARR_DELAY"])
+    return df.drop(index=_outlier_index(df["DEP_DELAY"]).union(_outlier_index(df["ARR_DELAY"])))
+
+
+def split(df, name):
+    """Notebook-style 80/20 split; the cancel model is stratified."""
+    stratify = df["CANCELLED"] if name == "cancel" else None
+    return train_test_split(df, test_size=0.2, stratify=stratify, random_state=42)
+
+
+class EncoderStats:
+    """Running count/sum per category for a TargetEncoder's columns.
+
+    Pipelines that predate this file carry only the smoothed encodings, so
+    the first run seeds every known category with ``pseudo_count``
+    observations at its current encoded value.
+    """
+
+    def __init__(self, n, total, columns):
+        self.n = n
+        self.total = total
+        self.columns = columns  # col -> {category: [count, sum]}
+
+    @classmethod
+    def from_encoder(cls, te, pseudo_count=20):
+        columns = {}
+        for entry in te.ordinal_encoder.mapping:
+            col = entry["col"]
+            codes = entry["mapping"]
+            values = te.mapping[col]
+            columns[col] = {
+                str(cat): [pseudo_count, pseudo_count * float(values[code])]
+                for cat, code in codes.items() if code > 0
+            }
+        n = pseudo_count * max((len(c) for c in columns.values()), default=1)
+        return cls(n, n * float(te._mean), columns)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["n"], data["total"], data["columns"])
+
+    def to_dict(self):
+        return {"n": self.n, "total": self.total, "columns": self.columns}
+
+    def update(self, X, y):
+        y = pd.Series(np.asarray(y, dtype=float), index=X.index)
+        self.n += len(y)
+        self.total += float(y.sum())
+        for col, cats in self.columns.items():
+            grouped = y.groupby(X[col].astype(str)).agg(["count", "sum"])
+            for cat, (count, total) in zip(grouped.index, grouped.to_numpy()):
+                seen = cats.setdefault(cat, [0, 0.0])
+                seen[0] += int(count)
+                seen[1] += float(total)
+
+    def apply(self, te):
+        """Rewrite ``te``'s ordinal codes and encodings from these statistics."""
+        prior = self.total / self.n
+        te._mean = prior
+        for entry in te.ordinal_encoder.mapping:
+            col = entry["col"]
+            codes = entry["mapping"]
+            known = {str(cat): code for cat, code in codes.items() if code > 0}
+            next_code = max(known.values(), default=0) + 1
+            for cat in self.columns[col]:
+                if cat not in known:
+                    known[cat] = next_code
+                    next_code += 1
+            entry["mapping"] = pd.concat([
+                pd.Series(known, dtype="int64"),
+                pd.Series([-2], index=[np.nan], dtype="int64"),
+            ])
+            stats = pd.DataFrame(
+                [(known[cat], count, total) for cat, (count, total) in self.columns[col].items()],
+                columns=["code", "count", "sum"],
+            ).set_index("code").sort_index()
+            weight = te._weighting(stats["count"])
+            encoded = prior * (1 - weight) + (stats["sum"] / stats["count"]) * weight
+            encoded.loc[-1] = prior
+            encoded.loc[-2] = prior
+            encoded.index.name = None
+            te.mapping[col] = encoded
+
+
+def _target_encoder(preprocessor):
+    return next(t for _, t, _ in preprocessor.transformers_ if type(t).__name__ == "TargetEncoder")
+
+
+def continue_pipeline(pipeline, X, y, stats, rounds):
+    """Copy of ``pipeline`` with refreshed encodings and ``rounds`` more trees."""
+    preprocessor = copy.deepcopy(pipeline.named_steps["preprocessor"])
+    stats.apply(_target_encoder(preprocessor))
+    step, old = pipeline.steps[-1]
+    model = clone(old).set_params(n_estimators=rounds)
+    model.fit(preprocessor.transform(X), y, xgb_model=old.get_booster())
+    return Pipeline([("preprocessor", preprocessor), (step, model)])
+
+
+def evaluate(pipeline, name, X, y):
+    if name == "cancel":
+        proba = pipeline.predict_proba(X)[:, 1]
+        return {
+            "auc": float(roc_auc_score(y, proba)) if y.nunique() > 1 else None,
+            "log_loss": float(log_loss(y, proba, labels=[0, 1])),
+        }
+    pred = pipeline.predict(X)
+    return {"mse": float(mean_squared_error(y, pred)), "mae": float(mean_absolute_error(y, pred))}
+
+
+def _read_version(model_dir):
+    version_file = Path(model_dir) / "VERSION"
+    return version_file.read_text().strip() if version_file.exists() else "baseline"
+
+
+def retrain(df, previous_dir=MODEL_DIR, output_root="model_versions", version=None, rounds=20):
+    """Write ``<output_root>/<version>`` and return the evaluation report."""
+    previous_dir = Path(previous_dir)
+    version = version or datetime.now().strftime("%Y%m%d%H%M%S")
+    out_dir = Path(output_root) / version
+    out_dir.mkdir(parents=True, exist_ok=False)
+
+    stats_path = previous_dir / TE_STATS_FILE
+    saved_stats = json.loads(stats_path.read_text()) if stats_path.exists() else {}
+    new_stats = {}
+    df = add_training_features(df)
+    delays = delay_frame(df)
+    report = {"version": version, "previous": _read_version(previous_dir), "rows": len(df), "models": {}}
+
+    for model_set, files in MODEL_FILES.items():
+        for name, fname in files.items():
+            pipeline = joblib.load(previous_dir / fname)
+            features = list(pipeline.feature_names_in_)
+            missing = [c for c in features if c not in df]
+            if missing:
+                print(f"{model_set}/{name}: missing {', '.join(missing[:3])}...; keeping previous model")
+                shutil.copy(previous_dir / fname, out_dir / fname)
+                continue
+
+            train, test = split(df if name == "cancel" else delays, name)
+            key = f"{model_set}/{name}"
+            stats = (EncoderStats.from_dict(saved_stats[key]) if key in saved_stats
+                     else EncoderStats.from_encoder(_target_encoder(pipeline.named_steps["preprocessor"])))
+            stats.update(train[features], train[ENCODER_TARGETS[name]])
+            new_stats[key] = stats.to_dict()
+
+            start = time.time()
+            updated = continue_pipeline(pipeline, train[features], train[MODEL_TARGETS[name]], stats, rounds)
+            joblib.dump(updated, out_dir / fname)
+            y_test = test[MODEL_TARGETS[name]]
+            report["models"][key] = {
+                "train_rows": len(train),
+                "test_rows": len(test),
+                "seconds": round(time.time() - start, 2),
+                "previous": evaluate(pipeline, name, test[features], y_test),
+                "new": evaluate(updated, name, test[features], y_test),
+            }
+
+    # Carry over statistics for models that were not retrained this time
+    for key, value in saved_stats.items():
+        new_stats.setdefault(key, value)
+    (out_dir / TE_STATS_FILE).write_text(json.dumps(new_stats))
+    (out_dir / "report.json").write_text(json.dumps(report, indent=2))
+    (out_dir / "VERSION").write_text(version + "\n")
+    return report
+
+
+def print_report(report):
+    print(f"Version {report['version']} (previous {report['previous']}), {report['rows']} new rows")
+    for key, result in report["models"].items():
+        metrics = ", ".join(
+            f"{metric} {result['previous'][metric]:.4f} -> {result['new'][metric]:.4f}"
+            for metric in result["new"] if result["new"][metric] is not None
+        )
+        print(f"  {key:<20} {metrics}  ({result['train_rows']} train rows, {result['seconds']}s)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Continue training the deployed models on new data.")
+    parser.add_argument("data", help="ingest.py dataset directory, or a CSV/Parquet file")
+    parser.add_argument("--months", type=int, nargs="*", help="only these months of the dataset")
+    parser.add_argument("--previous", default=str(MODEL_DIR), help="model directory to continue from")
+    parser.add_argument("--output", default="model_versions", help="root directory for new versions")
+    parser.add_argument("--version", default=None, help="version name (default: timestamp)")
+    parser.add_argument("--rounds", type=int, default=20, help="trees added to each model")
+    args = parser.parse_args(argv)
+
+    df = load_flights(args.data, args.months)
+    report = retrain(df, args.previous, args.output, args.version, args.rounds)
+    print_report(report)
+
+
+if __name__ == "__main__":
+    main()
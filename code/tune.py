@@ -0,0 +1,233 @@
+"""Parallel hyperparameter search for the six cancel/dep/arr pipelines.
+
+The notebook refits the full pipeline (target encoding included) for every
+candidate. Here each model's K folds are encoded once and stored as .npy
+files under ``--cache``; every trial then memory-maps them, so candidates
+share one copy of the data through the page cache. Trials for all six
+model/feature-set searches run in one process pool, each with XGBoost
+early stopping on its validation fold, and per-trial timings are recorded.
+
+    python tune.py combined.csv --cache fold_cache --workers 6 --output tuning.json
+
+``--grid`` takes a JSON file of parameter lists to replace DEFAULT_GRID.
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+from category_encoders import TargetEncoder
+from sklearn.compose import ColumnTransformer
+from sklearn.metrics import mean_squared_error, roc_auc_score
+from sklearn.model_selection import KFold, StratifiedKFold
+from sklearn.preprocessing import OneHotEncoder
+from xgboost import XGBClassifier, XGBRegressor
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "shiny-py"))
+from model_registry import MODEL_DIR, MODEL_FILES  # noqa: E402
+
+from retrain import MODEL_TARGETS, add_training_features, delay_frame, load_flights  # noqa: E402
+
+CAT_FEATURES_TE = ["ORIGIN_IATA", "DEST_IATA", "MKT_AIRLINE", "DEP_HOUR", "ARR_HOUR"]
+CAT_FEATURES_OHE = ["ORIGIN_TYPE", "DEST_TYPE", "WEEK"]
+
+DEFAULT_GRID = {
+    "max_depth": [4, 6, 8],
+    "learning_rate": [0.05, 0.1],
+    "subsample": [0.8, 0.9],
+    "colsample_bytree": [0.8],
+    "min_child_weight": [1, 5],
+}
+
+# Fixed settings from the notebook; n_estimators is an upper bound for early stopping
+BASE_PARAMS = {
+    "cancel": {"objective": "binary:logistic", "eval_metric": "auc", "random_state": 42},
+    "dep": {"objective": "reg:squarederror", "eval_metric": "rmse", "random_state": 42},
+    "arr": {"objective": "reg:squarederror", "eval_metric": "rmse", "random_state": 42},
+}
+
+
+def _preprocessor():
+    return ColumnTransformer(
+        transformers=[
+            ("target_encode", TargetEncoder(), CAT_FEATURES_TE),
+            ("onehot", OneHotEncoder(handle_unknown="ignore", sparse_output=False), CAT_FEATURES_OHE),
+        ],
+        remainder="passthrough",
+    )
+
+
+def _fingerprint(X, y, n_folds):
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(pd.util.hash_pandas_object(X, index=False).to_numpy().tobytes())
+    digest.update(np.asarray(y, dtype=np.float64).tobytes())
+    digest.update(str(n_folds).encode())
+    return digest.hexdigest()
+
+
+def materialize_folds(key, X, y, cache_dir, n_folds=5):
+    """Encode each fold once and save it as .npy; returns the fold directory.
+
+    The directory name includes a hash of the data, so reruns on the same
+    input reuse the cached folds and new data gets its own.
+    """
+    fold_dir = Path(cache_dir) / f"{key.replace('/', '_')}-{_fingerprint(X, y, n_folds)}"
+    if (fold_dir / "done").exists():
+        return fold_dir
+    fold_dir.mkdir(parents=True, exist_ok=True)
+    if key.endswith("/cancel"):
+        splitter = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=42)
+    else:
+        splitter = KFold(n_splits=n_folds, shuffle=True, random_state=42)
+    y = np.asarray(y)
+    for k, (train_idx, valid_idx) in enumerate(splitter.split(X, y)):
+        preprocessor = _preprocessor()
+        X_train = preprocessor.fit_transform(X.iloc[train_idx], y[train_idx])
+        X_valid = preprocessor.transform(X.iloc[valid_idx])
+        np.save(fold_dir / f"{k}_X_train.npy", np.asarray(X_train, dtype=np.float32))
+        np.save(fold_dir / f"{k}_y_train.npy", y[train_idx].astype(np.float32))
+        np.save(fold_dir / f"{k}_X_valid.npy", np.asarray(X_valid, dtype=np.float32))
+        np.save(fold_dir / f"{k}_y_valid.npy", y[valid_idx].astype(np.float32))
+    (fold_dir / "done").write_text(str(n_folds))
+    return fold_dir
+
+
+def load_fold(fold_dir, k):
+    return [np.load(fold_dir / f"{k}_{part}.npy", mmap_mode="r")
+            for part in ("X_train", "y_train", "X_valid", "y_valid")]
+
+
+def run_trial(key, fold_dir, params, n_estimators=1000, early_stopping_rounds=30, n_jobs=1):
+    """Score one candidate on every cached fold; runs inside a pool worker."""
+    name = key.split("/")[1]
+    n_folds = int((fold_dir / "done").read_text())
+    scores, rounds = [], []
+    start = time.perf_counter()
+    for k in range(n_folds):
+        X_train, y_train, X_valid, y_valid = load_fold(fold_dir, k)
+        settings = {**BASE_PARAMS[name], **params, "n_estimators": n_estimators,
+                    "early_stopping_rounds": early_stopping_rounds, "n_jobs": n_jobs}
+        if name == "cancel":
+            positives = float(y_train.sum())
+            settings.setdefault("scale_pos_weight", (len(y_train) - positives) / max(positives, 1.0))
+            model = XGBClassifier(**settings)
+        else:
+            model = XGBRegressor(**settings)
+        model.fit(X_train, y_train, eval_set=[(X_valid, y_valid)], verbose=False)
+        if name == "cancel":
+            scores.append(roc_auc_score(y_valid, model.predict_proba(X_valid)[:, 1]))
+        else:
+            scores.append(mean_squared_error(y_valid, model.predict(X_valid)))
+        rounds.append(model.best_iteration + 1)
+    return {
+        "model": key,
+        "params": params,
+        "metric": "auc" if name == "cancel" else "mse",
+        "score": float(np.mean(scores)),
+        "score_std": float(np.std(scores)),
+        "best_rounds": int(np.median(rounds)),
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+
+
+def _encode_task(key, X, y, cache_dir, n_folds):
+    start = time.perf_counter()
+    fold_dir = materialize_folds(key, X, y, cache_dir, n_folds)
+    return key, fold_dir, time.perf_counter() - start
+
+
+def candidates(grid):
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+
+
+def training_data(df, model_dir=MODEL_DIR, models=None):
+    """(X, y) per "model_set/name", with the features the deployed pipelines use."""
+    df = add_training_features(df)
+    delays = delay_frame(df)
+    data = {}
+    for model_set, files in MODEL_FILES.items():
+        for name, fname in files.items():
+            key = f"{model_set}/{name}"
+            if models and key not in models:
+                continue
+            features = list(joblib.load(Path(model_dir) / fname).feature_names_in_)
+            frame = df if name == "cancel" else delays
+            if any(c not in frame for c in features):
+                print(f"{key}: features missing from data, skipped")
+                continue
+            data[key] = (frame[features], frame[MODEL_TARGETS[name]].to_numpy())
+    return data
+
+
+def search(data, grid, cache_dir, workers=None, n_folds=5, n_estimators=1000, early_stopping_rounds=30):
+    """Run every candidate for every model; returns the per-trial results."""
+    workers = workers or os.cpu_count()
+    # Split cores between concurrent trials rather than oversubscribing
+    n_jobs = max(1, (os.cpu_count() or 1) // workers)
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        encoded = [pool.submit(_encode_task, key, X, y, cache_dir, n_folds) for key, (X, y) in data.items()]
+        trials = []
+        for future in as_completed(encoded):
+            key, fold_dir, seconds = future.result()
+            print(f"{key}: folds ready in {seconds:.1f}s")
+            trials += [
+                pool.submit(run_trial, key, fold_dir, params, n_estimators, early_stopping_rounds, n_jobs)
+                for params in candidates(grid)
+            ]
+        for future in as_completed(trials):
+            result = future.result()
+            results.append(result)
+            print(f"{result['model']:<20} {result['metric']} {result['score']:.4f} "
+                  f"({result['best_rounds']} rounds, {result['seconds']}s) {result['params']}")
+    return results
+
+
+def best_per_model(results):
+    best = {}
+    for result in results:
+        current = best.get(result["model"])
+        better = (result["score"] > current["score"] if result["metric"] == "auc"
+                  else result["score"] < current["score"]) if current else True
+        if better:
+            best[result["model"]] = result
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cross-validated hyperparameter search over cached folds.")
+    parser.add_argument("data", help="training CSV/Parquet (e.g. combined.csv) or ingest.py dataset")
+    parser.add_argument("--months", type=int, nargs="*")
+    parser.add_argument("--models", nargs="*", help='subset such as "weather/cancel"')
+    parser.add_argument("--grid", default=None, help="JSON file of parameter lists")
+    parser.add_argument("--cache", default="fold_cache", help="directory for encoded folds")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-rounds", type=int, default=1000)
+    parser.add_argument("--early-stopping", type=int, default=30)
+    parser.add_argument("--output", default="tuning.json")
+    args = parser.parse_args(argv)
+
+    grid = json.loads(Path(args.grid).read_text()) if args.grid else DEFAULT_GRID
+    start = time.time()
+    data = training_data(load_flights(args.data, args.months), models=args.models)
+    results = search(data, grid, args.cache, args.workers, args.folds, args.max_rounds, args.early_stopping)
+    best = best_per_model(results)
+    Path(args.output).write_text(json.dumps({"best": best, "trials": results}, indent=2))
+    print(f"\n{len(results)} trials in {time.time() - start:.0f}s")
+    for key, result in best.items():
+        print(f"  {key:<20} {result['metric']} {result['score']:.4f} {result['params']} "
+              f"n_estimators={result['best_rounds']}")
+
+
+if __name__ == "__main__":
+    main()
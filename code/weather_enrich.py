@@ -0,0 +1,126 @@
+"""Attach daily Meteostat weather for origin and destination to flight records.
+
+Replaces the per-row ``parallel_weather_fetch`` in weather_added.ipynb. The
+flights are first reduced to one date range per airport, each airport's
+whole range is fetched with a single ``Daily(...).fetch()`` call, and the
+result is merged back onto the flights in one vectorized join per side.
+
+    python weather_enrich.py processed_flights_May2024.csv airports_info_.csv flights_with_weather.csv
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from meteostat import Daily, Point
+
+WEATHER_KEYS = {
+    "temperature_avg_C": "tavg",
+    "temperature_min_C": "tmin",
+    "temperature_max_C": "tmax",
+    "precipitation_mm": "prcp",
+    "wind_speed_kph": "wspd",
+    "snow_mm": "snow",
+}
+
+
+def station_ranges(flights, airport_info):
+    """One row per airport: coordinates plus the first and last flight date."""
+    stops = pd.concat([
+        flights[["ORIGIN_IATA", "DATE"]].set_axis(["Airport", "DATE"], axis=1),
+        flights[["DEST_IATA", "DATE"]].set_axis(["Airport", "DATE"], axis=1),
+    ])
+    ranges = stops.groupby("Airport")["DATE"].agg(start="min", end="max").reset_index()
+    coords = airport_info[["Airport", "Latitude", "Longitude"]].drop_duplicates("Airport")
+    return ranges.merge(coords, on="Airport", how="inner")
+
+
+def fetch_station(airport, lat, lon, start, end, retries=3):
+    """Daily weather for one airport over [start, end] in a single request."""
+    for attempt in range(retries + 1):
+        try:
+            data = Daily(Point(lat, lon), start.to_pydatetime(), end.to_pydatetime()).fetch()
+            break
+        except Exception:
+            if attempt == retries:
+                return None
+            time.sleep(2 ** attempt)
+    if data.empty:
+        return None
+    data = data.reindex(columns=list(WEATHER_KEYS.values()))
+    data = data.rename(columns={v: k for k, v in WEATHER_KEYS.items()})
+    data.index.name = "DATE"
+    data = data.reset_index()
+    data.insert(0, "Airport", airport)
+    return data
+
+
+def fetch_weather_table(ranges, max_workers=10):
+    """Long table of (Airport, DATE, weather...) for every station range."""
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        frames = list(executor.map(
+            fetch_station,
+            ranges["Airport"], ranges["Latitude"], ranges["Longitude"], ranges["start"], ranges["end"],
+        ))
+    frames = [f for f in frames if f is not None]
+    if not frames:
+        return pd.DataFrame(columns=["Airport", "DATE"] + list(WEATHER_KEYS))
+    return pd.concat(frames, ignore_index=True)
+
+
+def join_weather(flights, weather, airport_info):
+    """Add coordinates and origin_/dest_ weather columns to every flight."""
+    coords = airport_info[["Airport", "Latitude", "Longitude"]].drop_duplicates("Airport")
+    for side, col in (("origin", "ORIGIN_IATA"), ("dest", "DEST_IATA")):
+        flights = flights.merge(
+            coords.rename(columns={
+                "Airport": col,
+                "Latitude": f"Latitude_{side}",
+                "Longitude": f"Longitude_{side}",
+            }),
+            on=col, how="left",
+        )
+        flights = flights.merge(
+            weather.rename(columns={"Airport": col, **{k: f"{side}_{k}" for k in WEATHER_KEYS}}),
+            on=[col, "DATE"], how="left",
+        )
+    return flights
+
+
+def enrich(flights, airport_info, max_workers=10):
+    flights = flights.copy()
+    flights["DATE"] = pd.to_datetime(flights["DATE"]).dt.normalize()
+
+    ranges = station_ranges(flights, airport_info)
+    start_time = time.time()
+    weather = fetch_weather_table(ranges, max_workers=max_workers)
+    print(f"Fetched {len(weather)} station-days for {len(ranges)} airports "
+          f"in {time.time() - start_time:.2f} seconds")
+
+    enriched = join_weather(flights, weather, airport_info)
+    enriched["DATE"] = enriched["DATE"].dt.strftime("%Y-%m-%d")
+    return enriched
+
+
+def _read(path):
+    return pd.read_parquet(path) if str(path).endswith(".parquet") else pd.read_csv(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Add origin/destination daily weather to flight data.")
+    parser.add_argument("flights", help="flight CSV/Parquet with ORIGIN_IATA, DEST_IATA and DATE")
+    parser.add_argument("airports", help="airports_info_.csv with Airport, Latitude, Longitude")
+    parser.add_argument("output", help="output CSV/Parquet")
+    parser.add_argument("--workers", type=int, default=10, help="concurrent Meteostat requests")
+    args = parser.parse_args(argv)
+
+    enriched = enrich(_read(args.flights), pd.read_csv(args.airports), max_workers=args.workers)
+    if args.output.endswith(".parquet"):
+        enriched.to_parquet(args.output, index=False)
+    else:
+        enriched.to_csv(args.output, index=False)
+    print(f"Saved enriched flight data ({len(enriched)} rows) to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+from collections import namedtuple
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+DATA_DIR = Path(__file__).parent / "data"
+
+DEFAULT_TYPE = "large_airport"
+
+Airport = namedtuple("Airport", ["code", "lat", "lon", "elev", "type", "tz"])
+
+
+class AirportRegistry:
+    """Airport attributes stored as parallel arrays keyed by IATA code.
+
+    Scalar lookups go through a dict of row positions; whole columns of
+    codes are resolved with a single ``Index.get_indexer`` call.
+    """
+
+    def __init__(self, codes, lat, lon, elev, types, tz):
+        self.codes = pd.Index(codes)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.elev = np.asarray(elev, dtype=np.int32)
+        # Airport types and timezones repeat a lot, so keep them as category codes
+        self.types = pd.Categorical(types)
+        self.tz = pd.Categorical(tz)
+        self._pos = {code: i for i, code in enumerate(self.codes)}
+
+    @classmethod
+    def from_csv(cls, data_dir=DATA_DIR):
+        data_dir = Path(data_dir)
+        info = pd.read_csv(data_dir / "airports_info_.csv").drop_duplicates("Airport")
+        types = pd.read_csv(data_dir / "type_airport.csv").drop_duplicates("origin").set_index("origin")["type"]
+        tz = pd.read_csv(data_dir / "airport_timezone.csv").drop_duplicates("iata_code").set_index("iata_code")["iana_tz"]
+
+        codes = info["Airport"].str.upper()
+        return cls(
+            codes=codes,
+            lat=info["Latitude"],
+            lon=info["Longitude"],
+            elev=info["Altitude"],
+            types=codes.map(types).fillna(DEFAULT_TYPE),
+            # Prefer the finer-grained IANA zone (e.g. America/Detroit) when we have one
+            tz=codes.map(tz).fillna(info["Tz database timezone"]),
+        )
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, code):
+        return _normalize(code) in self._pos
+
+    def get(self, code):
+        i = self._pos.get(_normalize(code))
+        if i is None:
+            return None
+        return Airport(self.codes[i], self.lat[i], self.lon[i], int(self.elev[i]), self.types[i], self.tz[i])
+
+    def coords(self, code):
+        i = self._pos.get(_normalize(code))
+        if i is None:
+            return (None, None)
+        return self.lat[i], self.lon[i]
+
+    def airport_type(self, code):
+        i = self._pos.get(_normalize(code))
+        return DEFAULT_TYPE if i is None else self.types[i]
+
+    def elevation(self, code):
+        i = self._pos.get(_normalize(code))
+        return 0 if i is None else int(self.elev[i])
+
+    def timezone(self, code):
+        i = self._pos.get(_normalize(code))
+        return None if i is None else self.tz[i]
+
+    def positions(self, codes):
+        """Row positions for a column of codes (-1 where unknown)."""
+        codes = pd.Series(codes, copy=False).astype("string").str.strip().str.upper()
+        return self.codes.get_indexer(codes)
+
+    def lookup(self, codes):
+        """Vectorized lookup returning one row of attributes per input code.
+
+        Unknown codes get NaN coordinates, elevation 0 and the default
+        airport type, matching the scalar helpers.
+        """
+        index = codes.index if isinstance(codes, pd.Series) else None
+        pos = self.positions(codes)
+        known = pos >= 0
+        safe = np.where(known, pos, 0)
+        types = np.asarray(self.types.categories)[self.types.codes[safe]]
+        tz = np.asarray(self.tz.categories)[self.tz.codes[safe]]
+        return pd.DataFrame({
+            "known": known,
+            "lat": np.where(known, self.lat[safe], np.nan),
+            "lon": np.where(known, self.lon[safe], np.nan),
+            "elev": np.where(known, self.elev[safe], 0),
+            "type": np.where(known, types, DEFAULT_TYPE),
+            "tz": np.where(known, tz, None),
+        }, index=index)
+
+
+def _normalize(code):
+    return str(code).strip().upper()
+
+
+@lru_cache(maxsize=None)
+def get_registry(data_dir=DATA_DIR):
+    """Process-wide registry, built on first use and shared by every caller."""
+    return AirportRegistry.from_csv(data_dir)
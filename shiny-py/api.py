@@ -0,0 +1,231 @@
+"""Lightweight JSON prediction API for machine-to-machine traffic.
+
+    POST /predict        {"origin": "JFK", "dest": "LAX", "date": "2025-06-01",
+                          "carrier": "AA", "dep_time": "08:00", "arr_time": "11:30"}
+    POST /predict/batch  {"flights": [{...}, {...}]}
+    POST /predict/sweep  {"origin": "JFK", "dest": "LAX", "date": "2025-06-01", "duration": 330,
+                          "carriers": [...], "dep_hours": [...], "rank_by": "arr_delay"}
+    GET  /health         liveness: answers as soon as the server is up
+    GET  /ready          503 until startup warm-up is done (see startup.py)
+    GET  /metrics        Prometheus text format
+
+Run standalone with ``uvicorn api:app`` (or ``python api.py``), or use
+``make_combined()`` / ``python api.py --with-ui`` to serve the API under
+/api next to the Shiny UI.
+"""
+import logging
+from contextlib import asynccontextmanager
+
+# First, so the startup report's import phase covers everything below
+import startup
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Mount, Route
+
+import metrics
+from congestion import CONGESTION_FEATURES
+from prediction_service import (
+    REQUEST_FIELDS,
+    UNCERTAINTY_COLUMNS,
+    InvalidInput,
+    carrier_warning,
+    models,
+    predict_batch_async,
+    predict_flight,
+    predict_sweep_async,
+)
+from uncertainty import COVERAGE
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on flights per batch request; bigger schedules belong in batch_predict.py
+MAX_BATCH_SIZE = 50000
+
+
+async def _json_body(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise InvalidInput("Request body must be JSON")
+    if not isinstance(body, dict):
+        raise InvalidInput("Request body must be a JSON object")
+    return body
+
+
+def _uncertainty(result):
+    """Per-row interval/calibration fields from UNCERTAINTY_COLUMNS, or None without tables."""
+    if UNCERTAINTY_COLUMNS[0] not in result:
+        return None
+    values = result[UNCERTAINTY_COLUMNS].astype(float).to_numpy()
+    rows = []
+    for dep_lo, dep_hi, arr_lo, arr_hi, calibrated in values.tolist():
+        rows.append({
+            "dep_delay_interval": None if dep_lo != dep_lo else [dep_lo, dep_hi],
+            "arr_delay_interval": None if arr_lo != arr_lo else [arr_lo, arr_hi],
+            "cancel_prob_calibrated": None if calibrated != calibrated else calibrated,
+            "interval_coverage": COVERAGE,
+        })
+    return rows
+
+
+async def predict(request):
+    try:
+        body = await _json_body(request)
+        missing = [f for f in REQUEST_FIELDS if f not in body]
+        if missing:
+            raise InvalidInput(f"Missing fields: {', '.join(missing)}")
+        predicted = await predict_flight(
+            body["origin"], body["dest"], body["date"], body["carrier"], body["dep_time"], body["arr_time"]
+        )
+    except InvalidInput as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    warning = carrier_warning(body["carrier"])
+    if warning:
+        predicted["warning"] = warning
+    return JSONResponse(predicted)
+
+
+async def predict_batch(request):
+    try:
+        body = await _json_body(request)
+        flights = body.get("flights")
+        if not isinstance(flights, list):
+            raise InvalidInput('Expected {"flights": [...]}')
+        if len(flights) > MAX_BATCH_SIZE:
+            raise InvalidInput(f"At most {MAX_BATCH_SIZE} flights per request")
+        result = await predict_batch_async(flights)
+    except ValueError as e:
+        # InvalidInput, or a schedule the batch scorer rejects (missing columns)
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    predictions = [
+        {"error": error} if error else {
+            "model_set": model_set,
+            "cancel_prob": cancel_prob,
+            "dep_delay": dep_delay,
+            "arr_delay": arr_delay,
+        }
+        for model_set, cancel_prob, dep_delay, arr_delay, error in zip(
+            result["MODEL_SET"], result["CANCEL_PROB"], result["DEP_DELAY_PRED"],
+            result["ARR_DELAY_PRED"], result["ERROR"],
+        )
+    ]
+    for prediction, carrier in zip(predictions, result["MKT_AIRLINE"]):
+        warning = None if "error" in prediction else carrier_warning(carrier)
+        if warning:
+            prediction["warning"] = warning
+    uncertainty = _uncertainty(result)
+    if uncertainty is not None:
+        for prediction, row in zip(predictions, uncertainty):
+            if "error" not in prediction:
+                prediction.update(row)
+    if CONGESTION_FEATURES[0] in result:
+        congestion = result[CONGESTION_FEATURES].astype(object).where(result[CONGESTION_FEATURES].notna(), None)
+        for prediction, row in zip(predictions, congestion.to_dict("records")):
+            if "error" not in prediction:
+                prediction["congestion"] = row if row[CONGESTION_FEATURES[0]] is not None else None
+    return JSONResponse({"predictions": predictions})
+
+
+async def predict_sweep(request):
+    try:
+        body = await _json_body(request)
+        missing = [f for f in ("origin", "dest", "date") if f not in body]
+        if missing:
+            raise InvalidInput(f"Missing fields: {', '.join(missing)}")
+        ranked = await predict_sweep_async(
+            body["origin"], body["dest"], body["date"],
+            duration=body.get("duration"),
+            carriers=body.get("carriers"),
+            dep_hours=body.get("dep_hours"),
+            schedule=body.get("schedule"),
+            rank_by=body.get("rank_by", "arr_delay"),
+        )
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    rejected = [
+        {"carrier": row.MKT_AIRLINE, "dep_time": row.SCH_DEP_TIME, "arr_time": row.SCH_ARR_TIME, "error": row.ERROR}
+        for row in ranked[ranked["ERROR"] != ""].itertuples(index=False)
+    ]
+    ranked = ranked[ranked["ERROR"] == ""]
+    options = [
+        {
+            "rank": int(row.RANK),
+            "carrier": row.MKT_AIRLINE,
+            "dep_time": row.SCH_DEP_TIME,
+            "arr_time": row.SCH_ARR_TIME,
+            "model_set": row.MODEL_SET,
+            "cancel_prob": float(row.CANCEL_PROB),
+            "dep_delay": float(row.DEP_DELAY_PRED),
+            "arr_delay": float(row.ARR_DELAY_PRED),
+        }
+        for row in ranked.itertuples(index=False)
+    ]
+    for option in options:
+        warning = carrier_warning(option["carrier"])
+        if warning:
+            option["warning"] = warning
+    uncertainty = _uncertainty(ranked)
+    if uncertainty is not None:
+        for option, row in zip(options, uncertainty):
+            option.update(row)
+    response = {"options": options}
+    if rejected:
+        response["rejected"] = rejected
+    return JSONResponse(response)
+
+
+async def health(request):
+    return JSONResponse({"status": "ok", "model_version": models.version})
+
+
+async def metrics_endpoint(request):
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+async def ready(request):
+    status = startup.report()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
+routes = [
+    Route("/predict", predict, methods=["POST"]),
+    Route("/predict/batch", predict_batch, methods=["POST"]),
+    Route("/predict/sweep", predict_sweep, methods=["POST"]),
+    Route("/health", health, methods=["GET"]),
+    Route("/ready", ready, methods=["GET"]),
+    Route("/metrics", metrics_endpoint, methods=["GET"]),
+]
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # After all imports, so a combined app's UI is part of the import phase
+    startup.start()
+    yield
+
+
+app = Starlette(routes=routes, lifespan=lifespan)
+
+
+def make_combined():
+    """Shiny UI at / and the JSON API at /api, in one ASGI app."""
+    from app import app as shiny_app
+
+    return Starlette(routes=[Mount("/api", app=app), Mount("/", app=shiny_app)], lifespan=lifespan)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the JSON prediction API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--with-ui", action="store_true", help="also serve the Shiny app at /")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    uvicorn.run(make_combined() if args.with_ui else app, host=args.host, port=args.port)
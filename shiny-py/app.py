@@ -1,16 +1,11 @@
+# First, so the startup report's import phase covers everything below
+import startup
 from shiny import App, ui, render, reactive
-import shiny
-import pandas as pd
-import joblib
-from datetime import datetime, timedelta
+from datetime import datetime
 # from hms import parse as parse_hms
-from weather_fetch import get_weather_features_for_user_input
-import category_encoders
-import xgboost
-import numpy as np
-import shiny.experimental as x
+from prediction_service import InvalidInput, predict_flight
+from route_stats import get_route_stats
 from pathlib import Path
-import os
 import logging
 
 
@@ -18,55 +13,6 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def parse_hms(timestr):
-    try:
-        return datetime.strptime(timestr, "%H:%M:%S").time()
-    except ValueError:
-        return None
-
-# 加载机场信息
-airport_info = pd.read_csv("data/airports_info_.csv")
-
-# Load airport type information
-#airport_types = pd.read_csv("type_airport.csv")
-airport_types = pd.read_csv("data/type_airport.csv")
-
-
-# 查找经纬度函数
-def get_coords(iata_code):
-    row = airport_info[airport_info['Airport'] == iata_code.upper()]
-    if row.empty:
-        return (None, None)
-    return row.iloc[0]['Latitude'], row.iloc[0]['Longitude']
-
-# Airport type lookup function
-def get_airport_type(iata_code):
-    row = airport_types[airport_types['origin'] == iata_code.upper()]
-    if row.empty:
-        return "large_airport"  # Default to large_airport if not found
-    return row.iloc[0]['type']
-
-# Load models with error handling
-try:
-    logger.info("Loading weather-based models...")
-    arrival_delay_weather = joblib.load('model/pipe_arr_weather.pkl')
-    departure_delay_weather = joblib.load('model/pipe_dep_weather.pkl')
-    cancellation_weather = joblib.load('model/pipe_cancel_weather.pkl')
-    logger.info("Weather-based models loaded successfully")
-except Exception as e:
-    logger.error(f"Error loading weather-based models: {str(e)}")
-    raise
-
-try:
-    logger.info("Loading non-weather models...")
-    arrival_delay_non_weather = joblib.load('model/pipe_arr_no_weather.pkl')
-    departure_delay_non_weather = joblib.load('model/pipe_dep_no_weather.pkl')
-    cancellation_non_weather = joblib.load('model/pipe_cancel_no_weather.pkl')
-    logger.info("Non-weather models loaded successfully")
-except Exception as e:
-    logger.error(f"Error loading non-weather models: {str(e)}")
-    raise
-
 # Configure static file serving
 www_dir = Path(__file__).parent / "www"
 static_assets = {
@@ -349,14 +295,7 @@ app_ui = ui.page_fluid(
             ui.h2("✈️ Travel Advice", style="font-weight: bold; color: white; text-align: center; margin-bottom: 20px;"),
             ui.div(
                 {"class": "advice-content"},
-                ui.tags.ul(
-                    ui.tags.li("Preferred Airlines: Delta Air Lines (DL), United Airlines (UA), and American Airlines (AA) generally offer more reliable service and are recommended for a smoother travel experience."),
-                    ui.tags.li("Best Travel Days: To reduce the risk of flight delays and cancelations, consider avoiding travel on Mondays, which tend to experience higher traffic and operational disruptions."),
-                    ui.tags.li("Monthly Advisory – January: In January, flights operated by United Airlines (UA) have shown a higher likelihood of cancelations and delays. Choosing Delta or American Airlines during this month may offer a more dependable option."),
-                    ui.tags.li("Airline Reliability: Delta and American Airlines consistently demonstrate lower cancelation rates and are preferred choices, particularly for time-sensitive travel. Conversely, Southwest and Alaska Airlines have shown less reliability in this regard and may be best avoided if schedule certainty is important."),
-                    ui.tags.li("Holiday Travel Guidance: Try to avoid scheduling flights within two days before or five days after major holidays. These peak travel windows often see elevated levels of congestion, leading to increased chances of delays and cancelations."),
-                    ui.tags.li("Tight Schedule Tip: For travelers with tight connections or critical timing, Delta and American Airlines are especially recommended due to their more consistent on-time performance.")
-                )
+                ui.output_ui("advice_list")
             ),
             ui.div(
                 {"style": "text-align: center; margin-top: 30px;"},
@@ -366,6 +305,63 @@ app_ui = ui.page_fluid(
     )
 )
 
+# Shown as-is when no statistics cube is available (see route_stats.py)
+HOLIDAY_ADVICE = "Holiday Travel Guidance: Try to avoid scheduling flights within two days before or five days after major holidays. These peak travel windows often see elevated levels of congestion, leading to increased chances of delays and cancelations."
+
+STATIC_ADVICE = [
+    "Preferred Airlines: Delta Air Lines (DL), United Airlines (UA), and American Airlines (AA) generally offer more reliable service and are recommended for a smoother travel experience.",
+    "Best Travel Days: To reduce the risk of flight delays and cancelations, consider avoiding travel on Mondays, which tend to experience higher traffic and operational disruptions.",
+    "Monthly Advisory – January: In January, flights operated by United Airlines (UA) have shown a higher likelihood of cancelations and delays. Choosing Delta or American Airlines during this month may offer a more dependable option.",
+    "Airline Reliability: Delta and American Airlines consistently demonstrate lower cancelation rates and are preferred choices, particularly for time-sensitive travel. Conversely, Southwest and Alaska Airlines have shown less reliability in this regard and may be best avoided if schedule certainty is important.",
+    HOLIDAY_ADVICE,
+    "Tight Schedule Tip: For travelers with tight connections or critical timing, Delta and American Airlines are especially recommended due to their more consistent on-time performance.",
+]
+
+
+def _describe(row):
+    return f"{row['on_time_rate']:.0%} on time, {row['cancel_rate']:.1%} cancelled"
+
+
+def baseline_advice(stats, origin, dest):
+    """Advice bullets computed from the historical statistics cube.
+
+    Uses the route in the form when it has enough history, otherwise all
+    flights.
+    """
+    route = {"origin": origin, "dest": dest}
+    scope = f"{origin}→{dest}"
+    if stats.query(**route)["flights"] < 200:
+        route, scope = {}, "all routes"
+
+    advice = []
+    carriers = stats.breakdown("MKT_AIRLINE", **route)
+    if len(carriers) >= 2:
+        carriers = carriers.sort_values("on_time_rate", ascending=False)
+        best = ", ".join(f"{row['MKT_AIRLINE']} ({_describe(row)})" for _, row in carriers.head(3).iterrows())
+        worst = carriers.iloc[-1]
+        advice.append(f"Preferred Airlines ({scope}): {best}. "
+                      f"Least reliable: {worst['MKT_AIRLINE']} ({_describe(worst)}).")
+    days = stats.breakdown("WEEK", **route)
+    if len(days) >= 2:
+        ranked = days.sort_values("on_time_rate", ascending=False)
+        best, worst = ranked.iloc[0], ranked.iloc[-1]
+        advice.append(f"Best Travel Days ({scope}): {best['WEEK']} has the best record ({_describe(best)}); "
+                      f"{worst['WEEK']} the worst ({_describe(worst)}).")
+    hours = stats.breakdown("DEP_HOUR", **route)
+    if len(hours) >= 2:
+        ranked = hours.sort_values("dep_delay_mean")
+        early = ", ".join(f"{int(h):02d}:00" for h in ranked["DEP_HOUR"].head(3))
+        late = ranked.iloc[-1]
+        advice.append(f"Departure Time ({scope}): the shortest average departure delays are for flights leaving at "
+                      f"{early}; {int(late['DEP_HOUR']):02d}:00 departures average {late['dep_delay_mean']:.0f} minutes late.")
+    overall = stats.query(**route)
+    if overall["flights"]:
+        advice.append(f"Typical Delays ({scope}): median arrival delay {overall['arr_delay_p50']:.0f} minutes, "
+                      f"1 in 10 flights arrives {overall['arr_delay_p90']:.0f}+ minutes late, "
+                      f"{overall['cancel_rate']:.1%} cancelled ({overall['flights']:,} flights).")
+    return advice
+
+
 # 服务器逻辑
 def server(input, output, session):
     # Add current page reactive value
@@ -387,6 +383,18 @@ def server(input, output, session):
     def _():
         current_page.set("home")
 
+    @output
+    @render.ui
+    def advice_list():
+        stats = get_route_stats()
+        if stats is None:
+            items = STATIC_ADVICE
+        else:
+            origin = (input.origin() or "JFK").strip().upper()
+            dest = (input.dest() or "LAX").strip().upper()
+            items = baseline_advice(stats, origin, dest) + [HOLIDAY_ADVICE]
+        return ui.tags.ul(*[ui.tags.li(item) for item in items])
+
     @output
     @render.text
     def prediction_output():
@@ -394,7 +402,7 @@ def server(input, output, session):
 
     @reactive.Effect
     @reactive.event(input.predict_btn)
-    def _():
+    async def _():
         # 获取用户输入
         origin = input.origin() or "JFK"
         dest = input.dest() or "LAX"
@@ -403,112 +411,43 @@ def server(input, output, session):
         dep_time = input.dep_time() or "08:00"
         arr_time = input.arr_time() or "11:30"
 
-        # Process times
-        dep_time_obj = parse_hms(f"{dep_time}:00" if len(dep_time) == 5 else dep_time)
-        arr_time_obj = parse_hms(f"{arr_time}:00" if len(arr_time) == 5 else arr_time)
-        
-        if not dep_time_obj or not arr_time_obj:
-            prediction_result.set("❌ Invalid time format. Please use HH:MM format (e.g., 08:00)")
+        try:
+            predicted = await predict_flight(origin, dest, flight_date, carrier, dep_time, arr_time)
+        except InvalidInput as e:
+            prediction_result.set(f"❌ {str(e)}")
             return
-
-        dep_time_min = dep_time_obj.hour * 60 + dep_time_obj.minute
-        arr_time_min = arr_time_obj.hour * 60 + arr_time_obj.minute
-        sch_duration = arr_time_min - dep_time_min
-        if sch_duration < 0:
-            sch_duration += 1440
-
-        # Calculate date difference
-        current_date = datetime.now().date()
-        days_difference = (flight_date - current_date).days
-
-        # 获取经纬度
-        lat_o, lon_o = get_coords(origin)
-        lat_d, lon_d = get_coords(dest)
-
-        if None in (lat_o, lon_o, lat_d, lon_d):
-            prediction_result.set("❌ Invalid airport code. Please check your airport codes.")
+        except Exception as e:
+            print(f"Error in prediction: {str(e)}")
+            prediction_result.set(f"❌ Prediction failed: {str(e)}")
             return
 
-        # Get airport types from the CSV file
-        origin_type = get_airport_type(origin)
-        dest_type = get_airport_type(dest)
-
-        # Base input data without weather features
-        input_data = {
-            'DATE': 0,
-            'CANCELLATION_CODE': 0,
-            'DEP_DELAY': 0,
-            'DEP_DELAY_NEW': 0,
-            'ARR_DELAY': 0,
-            'CARRIER_DELAY': 0,
-            'WEATHER_DELAY': 0,
-            'NAS_DELAY': 0,
-            'SECURITY_DELAY': 0,
-            'LATE_AIRCRAFT_DELAY': 0,
-            "WEEK": flight_date.strftime("%a"),
-            "MKT_AIRLINE": carrier.upper(),
-            "ORIGIN_IATA": origin.upper(),
-            "DEST_IATA": dest.upper(),
-            "SCH_DEP_TIME": dep_time_min,
-            "SCH_ARR_TIME": arr_time_min,
-            "SCH_DURATION": sch_duration,
-            "DISTANCE": 0,
-            "ORIGIN_TYPE": origin_type,  # Use looked-up origin airport type
-            "ORIGIN_ELEV": 0,
-            "DEST_TYPE": dest_type,  # Use looked-up destination airport type
-            "DEST_ELEV": 0,
-            "IS_WEEKEND": int(flight_date.weekday() >= 5),
-            "IS_HOLIDAY": 0,
-            "DEP_HOUR": dep_time_obj.hour,
-            "ARR_HOUR": arr_time_obj.hour,
-        }
-
-        try:
-            input_df = pd.DataFrame([input_data])
-            
-            if days_difference <= 7:  # Within a week
-                # Try to get weather info
-                weather_info = get_weather_features_for_user_input(
-                    lat_o, lon_o, lat_d, lon_d, flight_date.strftime("%Y-%m-%d")
-                )
-                
-                if weather_info is not None:
-                    # Use weather model if we have weather data
-                    input_data.update(weather_info)
-                    input_df = pd.DataFrame([input_data])
-                    
-                    # Get all predictions using weather models
-                    cancel_prob = cancellation_weather.predict_proba(input_df)[0,1]
-                    arr_delay = arrival_delay_weather.predict(input_df)[0]
-                    dep_delay = departure_delay_weather.predict(input_df)[0]
-                    
-                    result = f"""✈️ Prediction Results (Weather-based Model):
+        # Calibrated probability and interval ranges when the models have uncertainty tables
+        cancel_prob = predicted.get("cancel_prob_calibrated")
+        if cancel_prob is None:
+            cancel_prob = predicted["cancel_prob"]
+        dep_range = arr_range = ""
+        if predicted.get("dep_delay_interval"):
+            lo, hi = predicted["dep_delay_interval"]
+            dep_range = f" ({predicted['interval_coverage']:.0%} range {lo:.0f} to {hi:.0f})"
+        if predicted.get("arr_delay_interval"):
+            lo, hi = predicted["arr_delay_interval"]
+            arr_range = f" ({predicted['interval_coverage']:.0%} range {lo:.0f} to {hi:.0f})"
 
-🔴 Cancellation Probability: {cancel_prob:.1%}
-🟠 Expected Departure Delay: {dep_delay:.1f} minutes
-🟡 Expected Arrival Delay: {arr_delay:.1f} minutes"""
-                    prediction_result.set(result)
-                    return
-                
-            # If no weather data or beyond 7 days, use non-weather model
-            cancel_prob = cancellation_non_weather.predict_proba(input_df)[0,1]
-            arr_delay = arrival_delay_non_weather.predict(input_df)[0]
-            dep_delay = departure_delay_non_weather.predict(input_df)[0]
-            
-            model_type = "Historical Data Model"
-            result = f"""✈️ Prediction Results ({model_type}):
+        result = f"""✈️ Prediction Results ({predicted['model_label']}):
 
 🔴 Cancellation Probability: {cancel_prob:.1%}
-🟠 Expected Departure Delay: {dep_delay:.1f} minutes
-🟡 Expected Arrival Delay: {arr_delay:.1f} minutes"""
-            prediction_result.set(result)
-            
-        except Exception as e:
-            print(f"Error in prediction: {str(e)}")
-            prediction_result.set(f"❌ Prediction failed: {str(e)}")
+🟠 Expected Departure Delay: {predicted['dep_delay']:.1f} minutes{dep_range}
+🟡 Expected Arrival Delay: {predicted['arr_delay']:.1f} minutes{arr_range}"""
+        congestion = predicted.get("congestion")
+        if congestion and congestion["ORIGIN_DELAY_1H"] is not None:
+            result += (f"\n\n🛫 Right now at {origin.strip().upper()}: departures average "
+                       f"{congestion['ORIGIN_DELAY_1H']:.0f} min late over the last hour, "
+                       f"{congestion['ORIGIN_CANCELLED_1H']:.0f} cancelled")
+        prediction_result.set(result)
 
 # Initialize the app
 app = App(app_ui, server, static_assets=www_dir)
+startup.start()
 
 if __name__ == "__main__":
     import shiny
@@ -0,0 +1,272 @@
+import argparse
+import logging
+from concurrent.futures import Future
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from airports import AirportRegistry
+from calendar_features import calendar_features, hhmm, hour_of
+from congestion import CONGESTION_FEATURES, CongestionStore, read_events
+from metrics import inc, span
+from model_registry import ModelRegistry
+from uncertainty import OUTPUT_COLUMNS as UNCERTAINTY_COLUMNS
+from uncertainty import tables_for
+from weather_fetch import submit_forecast
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).parent
+
+# Columns a schedule file must provide (times as HH:MM, date as YYYY-MM-DD)
+INPUT_COLUMNS = ["ORIGIN_IATA", "DEST_IATA", "MKT_AIRLINE", "DATE", "SCH_DEP_TIME", "SCH_ARR_TIME"]
+
+BASE_FEATURES = [
+    "WEEK", "MKT_AIRLINE", "ORIGIN_IATA", "DEST_IATA", "SCH_DEP_TIME", "SCH_ARR_TIME",
+    "SCH_DURATION", "DISTANCE", "ORIGIN_TYPE", "ORIGIN_ELEV", "DEST_TYPE", "DEST_ELEV",
+]
+WEATHER_KEYS = [
+    "temperature_avg_C", "temperature_min_C", "temperature_max_C",
+    "precipitation_mm", "wind_speed_kph", "snow_mm",
+]
+WEATHER_FEATURES = [f"origin_{k}" for k in WEATHER_KEYS] + [f"dest_{k}" for k in WEATHER_KEYS]
+CALENDAR_FEATURES = ["IS_WEEKEND", "IS_HOLIDAY", "DEP_HOUR", "ARR_HOUR"]
+
+# Inputs of the shipped models. Scoring selects each model's own
+# feature_names_in_, so retrained models may add columns such as
+# CONGESTION_FEATURES
+FEATURES = {
+    "weather": BASE_FEATURES + WEATHER_FEATURES + CALENDAR_FEATURES,
+    "no_weather": BASE_FEATURES + CALENDAR_FEATURES,
+}
+
+# Weather is only available (forecast or history) up to a week ahead
+WEATHER_HORIZON_DAYS = 7
+
+OUTPUT_COLUMNS = ["MODEL_SET", "CANCEL_PROB", "DEP_DELAY_PRED", "ARR_DELAY_PRED", "ERROR"]
+
+
+def _parse_times(times):
+    # Accept both HH:MM and HH:MM:SS, same as the interactive form
+    times = times.astype("string").str.strip()
+    times = times.where(times.str.len() != 5, times + ":00")
+    return pd.to_datetime(times, format="%H:%M:%S", errors="coerce")
+
+
+def build_features(flights, airports, today=None):
+    """Validate a schedule frame and build model features for every row.
+
+    Returns a feature frame aligned with ``flights`` plus a Series of error
+    messages (empty string for rows that can be scored).
+    """
+    missing = [c for c in INPUT_COLUMNS if c not in flights.columns]
+    if missing:
+        raise ValueError(f"Input is missing required columns: {missing}")
+
+    today = today or datetime.now().date()
+    errors = pd.Series("", index=flights.index, dtype=object)
+
+    origin = flights["ORIGIN_IATA"].astype("string").str.strip().str.upper()
+    dest = flights["DEST_IATA"].astype("string").str.strip().str.upper()
+    carrier = flights["MKT_AIRLINE"].astype("string").str.strip().str.upper()
+    dates = pd.to_datetime(flights["DATE"], errors="coerce", format="%Y-%m-%d")
+    dep = _parse_times(flights["SCH_DEP_TIME"])
+    arr = _parse_times(flights["SCH_ARR_TIME"])
+
+    origin_info = airports.lookup(origin)
+    dest_info = airports.lookup(dest)
+
+    errors[(carrier.isna() | (carrier == "")).to_numpy(dtype=bool, na_value=True)] = "Missing carrier"
+    bad_airport = ~origin_info["known"] | ~dest_info["known"]
+    errors[bad_airport.to_numpy()] = "Invalid airport code"
+    errors[(dep.isna() | arr.isna()).to_numpy()] = "Invalid time format"
+    errors[dates.isna().to_numpy()] = "Invalid date"
+
+    dep_min = dep.dt.hour * 60 + dep.dt.minute
+    arr_min = arr.dt.hour * 60 + arr.dt.minute
+    duration = (arr_min - dep_min) % 1440
+    # Clock times in hhmm, as in the BTS training data
+    dep_hhmm = hhmm(dep.dt.hour, dep.dt.minute)
+    arr_hhmm = hhmm(arr.dt.hour, arr.dt.minute)
+    calendar = calendar_features(dates)
+
+    features = pd.DataFrame({
+        "WEEK": calendar["WEEK"],
+        "MKT_AIRLINE": carrier,
+        "ORIGIN_IATA": origin,
+        "DEST_IATA": dest,
+        "SCH_DEP_TIME": dep_hhmm,
+        "SCH_ARR_TIME": arr_hhmm,
+        "SCH_DURATION": duration,
+        "DISTANCE": 0,
+        "ORIGIN_TYPE": origin_info["type"],
+        "ORIGIN_ELEV": origin_info["elev"],
+        "DEST_TYPE": dest_info["type"],
+        "DEST_ELEV": dest_info["elev"],
+        "IS_WEEKEND": calendar["IS_WEEKEND"].fillna(0).astype(int),
+        "IS_HOLIDAY": calendar["IS_HOLIDAY"].fillna(0).astype(int),
+        "DEP_HOUR": hour_of(dep_hhmm),
+        "ARR_HOUR": hour_of(arr_hhmm),
+    }, index=flights.index)
+    features = features.astype({"WEEK": object, "MKT_AIRLINE": object, "ORIGIN_IATA": object, "DEST_IATA": object})
+
+    features["DATE"] = dates.dt.strftime("%Y-%m-%d")
+    features["DAYS_AHEAD"] = (dates.dt.normalize() - pd.Timestamp(today)).dt.days
+    features[["origin_lat", "origin_lon"]] = origin_info[["lat", "lon"]].to_numpy()
+    features[["dest_lat", "dest_lon"]] = dest_info[["lat", "lon"]].to_numpy()
+    return features, errors
+
+
+def attach_weather(features, mask, fetch=submit_forecast):
+    """Look up weather once per unique (airport, date) among ``mask`` rows.
+
+    ``fetch(lat, lon, date)`` starts one lookup and returns a
+    concurrent.futures Future. All lookups are started before any is
+    awaited, so they run in parallel on the weather module's own pool.
+    Rows whose origin or destination weather is unavailable are dropped from
+    the returned mask so they fall back to the historical models.
+    """
+    rows = features.loc[mask]
+    points = pd.concat([
+        rows[["origin_lat", "origin_lon", "DATE"]].set_axis(["lat", "lon", "DATE"], axis=1),
+        rows[["dest_lat", "dest_lon", "DATE"]].set_axis(["lat", "lon", "DATE"], axis=1),
+    ]).drop_duplicates()
+
+    futures = [fetch(lat, lon, date) for lat, lon, date in zip(points["lat"], points["lon"], points["DATE"])]
+    fetched = [future.result() for future in futures]
+    records = [
+        {"lat": lat, "lon": lon, "DATE": date, **weather}
+        for (lat, lon, date), weather in zip(points.itertuples(index=False), fetched)
+        if weather is not None
+    ]
+    weather = pd.DataFrame(records, columns=["lat", "lon", "DATE"] + WEATHER_KEYS)
+
+    for side in ("origin", "dest"):
+        side_weather = weather.rename(columns={
+            "lat": f"{side}_lat", "lon": f"{side}_lon",
+            **{k: f"{side}_{k}" for k in WEATHER_KEYS},
+        })
+        joined = rows[[f"{side}_lat", f"{side}_lon", "DATE"]].merge(
+            side_weather, how="left", on=[f"{side}_lat", f"{side}_lon", "DATE"]
+        )
+        cols = [f"{side}_{k}" for k in WEATHER_KEYS]
+        features.loc[mask, cols] = joined[cols].to_numpy(dtype=float)
+
+    has_weather = features[WEATHER_FEATURES].notna().all(axis=1)
+    return mask & has_weather
+
+
+def score_frame(flights, models, airports, today=None, fetch=submit_forecast, congestion=None):
+    """Score a whole schedule through the weather and historical pipelines.
+
+    Each model set is called once on all of its rows rather than once per
+    flight. Returns ``flights`` with the prediction columns appended, plus
+    UNCERTAINTY_COLUMNS when the models have uncertainty tables and
+    CONGESTION_FEATURES when a ``congestion`` store is given.
+    """
+    with span("build_features"):
+        features, errors = build_features(flights, airports, today=today)
+    valid = (errors == "").to_numpy()
+    if congestion is not None:
+        dep = features["SCH_DEP_TIME"]
+        departures = pd.to_datetime(features["DATE"]) + pd.to_timedelta(hour_of(dep) * 60 + dep % 100, unit="min")
+        with span("congestion"):
+            congestion.attach(features, departures)
+
+    use_weather = valid & (features["DAYS_AHEAD"] <= WEATHER_HORIZON_DAYS).to_numpy()
+    for col in WEATHER_FEATURES:
+        features[col] = np.nan
+    if use_weather.any():
+        with span("weather_fetch"):
+            use_weather = attach_weather(features, use_weather, fetch=fetch).to_numpy()
+    use_historical = valid & ~use_weather
+
+    result = flights.copy()
+    result["MODEL_SET"] = None
+    for col in ("CANCEL_PROB", "DEP_DELAY_PRED", "ARR_DELAY_PRED"):
+        result[col] = np.nan
+    result["ERROR"] = errors.to_numpy()
+    tables = tables_for(models)
+    if tables is not None:
+        for col in UNCERTAINTY_COLUMNS:
+            result[col] = np.nan
+    if congestion is not None:
+        result[CONGESTION_FEATURES] = features[CONGESTION_FEATURES].to_numpy()
+
+    for model_set, mask in (("weather", use_weather), ("no_weather", use_historical)):
+        if not mask.any():
+            continue
+        # One shared feature transform feeds all three boosters
+        predictor = models.fused(model_set)
+        columns = list(predictor.feature_names_in_)
+        for col in columns:
+            if col in CONGESTION_FEATURES and col not in features:
+                features[col] = np.nan  # no congestion store: missing values
+        X = features.loc[mask, columns]
+        predicted = predictor.predict(X)
+        result.loc[mask, "MODEL_SET"] = model_set
+        result.loc[mask, "CANCEL_PROB"] = predicted["cancel_prob"]
+        result.loc[mask, "DEP_DELAY_PRED"] = predicted["dep_delay"]
+        result.loc[mask, "ARR_DELAY_PRED"] = predicted["arr_delay"]
+        if tables is not None:
+            for col, values in tables.apply(model_set, features.loc[mask], predicted).items():
+                result.loc[mask, col] = values
+        inc("predictions_total", int(mask.sum()), model_set=model_set, path="batch")
+        logger.info(f"Scored {int(mask.sum())} flights with {model_set} models")
+
+    return result
+
+
+def _no_weather(lat, lon, date):
+    future = Future()
+    future.set_result(None)
+    return future
+
+
+def read_table(path):
+    path = Path(path)
+    if path.suffix == ".parquet":
+        return pd.read_parquet(path)
+    return pd.read_csv(path, dtype={"SCH_DEP_TIME": str, "SCH_ARR_TIME": str})
+
+
+def write_table(df, path):
+    path = Path(path)
+    if path.suffix == ".parquet":
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a flight schedule (CSV or Parquet) in batch.")
+    parser.add_argument("input", help="schedule with columns " + ", ".join(INPUT_COLUMNS))
+    parser.add_argument("output", help="where to write predictions (.csv or .parquet)")
+    parser.add_argument("--model-dir", default=BASE_DIR / "model")
+    parser.add_argument("--data-dir", default=BASE_DIR / "data")
+    parser.add_argument("--no-weather", action="store_true", help="skip weather lookups and use historical models only")
+    parser.add_argument("--congestion", default=None,
+                        help="flight status events (JSONL/CSV) to join current congestion from")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    airports = AirportRegistry.from_csv(args.data_dir)
+    # Only the model sets the schedule actually needs get loaded
+    models = ModelRegistry(args.model_dir)
+
+    flights = read_table(args.input)
+    fetch = _no_weather if args.no_weather else submit_forecast
+    congestion = None
+    if args.congestion:
+        congestion = CongestionStore()
+        for event in read_events(args.congestion):
+            congestion.update(event)
+        logger.info(f"Read {len(congestion)} congestion events up to {congestion.clock}")
+    result = score_frame(flights, models, airports, fetch=fetch, congestion=congestion)
+    write_table(result, args.output)
+    logger.info(f"Wrote {len(result)} predictions to {args.output} ({(result['ERROR'] != '').sum()} rejected)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""Offline latency and throughput benchmarks for the prediction path.
+
+Meteostat is replaced by a local stub (with optional simulated latency),
+and flights are synthesized from airports in data/airports_info_.csv, so
+runs are reproducible without network access. Measured:
+
+* single-row latency (p50/p95/p99) of each of the six pipelines, through
+  the sklearn Pipeline and the compiled path
+* rows/second for batches of 1, 100, 10k and 1M rows per pipeline
+* per-stage timings of one interactive prediction: input parsing and
+  airport lookup, weather fetch (cold and cached), DataFrame
+  construction, fused model call, and the whole ``predict_flight``
+* end-to-end ``score_frame`` throughput
+
+    python benchmark.py --output bench.json
+    python benchmark.py --output new.json --compare bench.json
+"""
+import os
+
+# Keep the benchmark self-contained: no on-disk caches, nothing shared with the app
+os.environ.setdefault("WEATHER_CACHE_BACKEND", "memory")
+os.environ.setdefault("PREDICTION_CACHE_BACKEND", "memory")
+
+import argparse  # noqa: E402
+import asyncio  # noqa: E402
+import json  # noqa: E402
+import platform  # noqa: E402
+import subprocess  # noqa: E402
+import time  # noqa: E402
+import warnings  # noqa: E402
+from datetime import date, timedelta  # noqa: E402
+from pathlib import Path  # noqa: E402
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+import weather_fetch  # noqa: E402
+from airports import DATA_DIR  # noqa: E402
+from batch_predict import FEATURES, WEATHER_FEATURES, build_features, score_frame  # noqa: E402
+from model_registry import MODEL_FILES  # noqa: E402
+
+BATCH_SIZES = [1, 100, 10_000, 1_000_000]
+
+
+class StubPoint:
+    def __init__(self, lat, lon, alt=None):
+        self.lat, self.lon = lat, lon
+
+
+class StubDaily:
+    """Stands in for meteostat.Daily: deterministic weather, optional delay."""
+
+    latency = 0.0
+
+    def __init__(self, location, start, end):
+        self.location = location
+        self.start = start
+
+    def fetch(self):
+        if self.latency:
+            time.sleep(self.latency)
+        seed = abs(hash((round(self.location.lat, 2), round(self.location.lon, 2), self.start.toordinal())))
+        rng = np.random.default_rng(seed % 2 ** 32)
+        tavg = rng.normal(15, 10)
+        return pd.DataFrame([{
+            "tavg": tavg, "tmin": tavg - 5, "tmax": tavg + 5,
+            "prcp": rng.exponential(2), "wspd": rng.uniform(0, 40), "snow": 0.0,
+        }])
+
+
+def install_weather_stub(latency=0.0):
+    StubDaily.latency = latency
+    weather_fetch.Point = StubPoint
+    weather_fetch.Daily = StubDaily
+
+
+def synthetic_schedule(n, seed=0, airports_csv=DATA_DIR / "airports_info_.csv"):
+    """Random flights between airports in airports_info_.csv, up to 30 days out."""
+    from prediction_service import SWEEP_CARRIERS
+
+    rng = np.random.default_rng(seed)
+    codes = pd.read_csv(airports_csv)["Airport"].dropna().str.upper().unique()
+    dep = rng.integers(5 * 60, 23 * 60, n)
+    arr = (dep + rng.integers(45, 360, n)) % 1440
+    days = rng.integers(0, 30, n)
+    return pd.DataFrame({
+        "ORIGIN_IATA": rng.choice(codes, n),
+        "DEST_IATA": rng.choice(codes, n),
+        "MKT_AIRLINE": rng.choice(SWEEP_CARRIERS, n),
+        "DATE": [(date.today() + timedelta(days=int(d))).isoformat() for d in days],
+        "SCH_DEP_TIME": [f"{m // 60:02d}:{m % 60:02d}" for m in dep],
+        "SCH_ARR_TIME": [f"{m // 60:02d}:{m % 60:02d}" for m in arr],
+    })
+
+
+def synthetic_features(n, airports, seed=0):
+    """Model-ready feature rows (weather columns filled) for ``n`` flights."""
+    features, errors = build_features(synthetic_schedule(n, seed), airports)
+    rng = np.random.default_rng(seed)
+    for col in WEATHER_FEATURES:
+        features[col] = rng.normal(10, 5, len(features)).clip(0)
+    return features[errors == ""].reset_index(drop=True)
+
+
+def percentiles(samples):
+    ms = np.asarray(samples) * 1000
+    return {
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+        "n": len(ms),
+    }
+
+
+def time_each(fn, args, warmup=5):
+    for a in args[:warmup]:
+        fn(a)
+    samples = []
+    for a in args:
+        start = time.perf_counter()
+        fn(a)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def _tile(X, n):
+    reps = -(-n // len(X))
+    return pd.concat([X] * reps, ignore_index=True).iloc[:n] if reps > 1 else X.iloc[:n]
+
+
+def bench_pipelines(registry, features, repeats, sizes):
+    """Single-row latency and batch throughput of every pipeline."""
+    from compiled_model import compile_pipeline
+
+    results = {}
+    for model_set, files in MODEL_FILES.items():
+        X = features[FEATURES[model_set]]
+        rows = [X.iloc[[i % len(X)]] for i in range(repeats)]
+        dict_rows = [r.iloc[0].to_dict() for r in rows]
+        for name in files:
+            pipeline = registry[model_set][name]
+            compiled = compile_pipeline(pipeline)
+            predict = pipeline.predict_proba if name == "cancel" else pipeline.predict
+            entry = {
+                "single_row": {
+                    "sklearn": percentiles(time_each(predict, rows)),
+                    "compiled": percentiles(time_each(compiled.predict, dict_rows)),
+                },
+                "batch_rows_per_s": {"sklearn": {}, "compiled": {}},
+            }
+            for size in sizes:
+                batch = _tile(X, size)
+                for label, fn in (("sklearn", predict), ("compiled", compiled.predict)):
+                    fn(batch.iloc[:1])
+                    start = time.perf_counter()
+                    fn(batch)
+                    entry["batch_rows_per_s"][label][str(size)] = size / (time.perf_counter() - start)
+            results[f"{model_set}/{name}"] = entry
+            print(f"{model_set}/{name}: sklearn p50 {entry['single_row']['sklearn']['p50_ms']:.2f} ms, "
+                  f"compiled p50 {entry['single_row']['compiled']['p50_ms']:.3f} ms, "
+                  + ", ".join(f"{s}: {entry['batch_rows_per_s']['sklearn'][str(s)]:,.0f}/"
+                              f"{entry['batch_rows_per_s']['compiled'][str(s)]:,.0f} rows/s" for s in sizes))
+    return results
+
+
+def bench_stages(schedule, repeats):
+    """Where the time goes in one interactive prediction."""
+    import prediction_service as ps
+
+    flights = schedule.head(repeats).to_dict("records")
+    stages = {key: [] for key in ("parse_and_lookup", "weather_cold", "weather_cached", "frame",
+                                  "fused_predict", "predict_flight")}
+    for flight in flights:
+        args = (flight["ORIGIN_IATA"], flight["DEST_IATA"], flight["DATE"], flight["MKT_AIRLINE"],
+                flight["SCH_DEP_TIME"], flight["SCH_ARR_TIME"])
+        try:
+            start = time.perf_counter()
+            row = ps.build_input(*args)
+            stages["parse_and_lookup"].append(time.perf_counter() - start)
+        except ps.InvalidInput:
+            continue
+        coords = (*ps.airports.coords(row["ORIGIN_IATA"]), *ps.airports.coords(row["DEST_IATA"]))
+        for stage in ("weather_cold", "weather_cached"):
+            start = time.perf_counter()
+            weather = weather_fetch.get_weather_features_for_user_input(*coords, flight["DATE"])
+            stages[stage].append(time.perf_counter() - start)
+        row.update(weather or {})
+        model_set = "weather" if weather else "no_weather"
+
+        start = time.perf_counter()
+        pd.DataFrame([row])
+        stages["frame"].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        ps.models.fused(model_set).predict(row)
+        stages["fused_predict"].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        asyncio.run(ps.predict_flight(*args))
+        stages["predict_flight"].append(time.perf_counter() - start)
+    return {stage: percentiles(samples) for stage, samples in stages.items() if samples}
+
+
+def bench_score_frame(registry, airports, sizes):
+    results = {}
+    for size in sizes:
+        schedule = synthetic_schedule(size, seed=size)
+        start = time.perf_counter()
+        score_frame(schedule, registry, airports)
+        results[str(size)] = size / (time.perf_counter() - start)
+        print(f"score_frame {size}: {results[str(size)]:,.0f} rows/s")
+    return results
+
+
+def environment():
+    import sklearn
+    import xgboost
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=Path(__file__).parent).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "sklearn": sklearn.__version__,
+        "xgboost": xgboost.__version__,
+    }
+
+
+def _leaves(tree, prefix=()):
+    for key, value in tree.items():
+        if isinstance(value, dict):
+            yield from _leaves(value, prefix + (key,))
+        elif isinstance(value, float):
+            yield prefix + (key,), value
+
+
+def compare(old, new):
+    """Print every metric that moved by more than 10% between two result files."""
+    old_values = dict(_leaves({k: v for k, v in old.items() if k != "environment"}))
+    print(f"\nCompared with {old.get('environment', {}).get('commit')}:")
+    for path, value in _leaves({k: v for k, v in new.items() if k != "environment"}):
+        before = old_values.get(path)
+        if not before:
+            continue
+        ratio = value / before
+        if abs(ratio - 1) > 0.1:
+            # Latencies should go down, throughputs up
+            better = ratio > 1 if any("rows_per_s" in part for part in path) else ratio < 1
+            print(f"  {'/'.join(path)}: {before:,.3f} -> {value:,.3f} ({ratio:.2f}x, {'better' if better else 'WORSE'})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline latency/throughput benchmarks.")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--compare", default=None, help="earlier result file to compare with")
+    parser.add_argument("--repeats", type=int, default=300, help="single-row samples per measurement")
+    parser.add_argument("--sizes", type=int, nargs="*", default=BATCH_SIZES)
+    parser.add_argument("--weather-latency", type=float, default=0.0, help="simulated Meteostat delay (s)")
+    args = parser.parse_args(argv)
+
+    warnings.filterwarnings("ignore")
+    install_weather_stub(args.weather_latency)
+    from airports import get_registry
+    from model_registry import ModelRegistry
+
+    airports = get_registry()
+    registry = ModelRegistry()
+    features = synthetic_features(min(max(args.sizes), 100_000), airports)
+
+    results = {"environment": environment()}
+    results["pipelines"] = bench_pipelines(registry, features, args.repeats, args.sizes)
+    results["stages"] = bench_stages(synthetic_schedule(args.repeats, seed=1), args.repeats)
+    results["score_frame_rows_per_s"] = bench_score_frame(registry, airports, [s for s in args.sizes if s <= 100_000])
+    for stage, stats in results["stages"].items():
+        print(f"{stage:<18} p50 {stats['p50_ms']:.3f} ms  p99 {stats['p99_ms']:.3f} ms")
+
+    Path(args.output).write_text(json.dumps(results, indent=2))
+    print(f"Wrote {args.output}")
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text()), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Returned by get() when a key is absent or expired, so that a cached None
+# (a remembered failure) can be told apart from a miss.
+MISSING = object()
+
+
+class MemoryCache:
+    """Thread-safe in-process LRU cache with a per-entry TTL."""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return MISSING
+            value, expires = entry
+            if expires is not None and expires <= now:
+                del self._data[key]
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return MISSING
+            self._data.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = None if ttl is None else time.time() + ttl
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, size=len(self._data))
+
+
+class SQLiteCache:
+    """On-disk LRU cache that several processes can share.
+
+    Values are stored as JSON. The database runs in WAL mode, and reads are
+    plain SELECTs, so a cache hit never waits for the write lock. Access
+    times and hit/miss counters are kept in memory and written in one
+    transaction every ``flush_every`` reads or ``flush_interval`` seconds;
+    the counters live in the same file, so they add up across processes.
+    The size limit is enforced every ``evict_every`` inserts, so the table
+    can briefly hold a few more than ``max_entries`` rows.
+    """
+
+    def __init__(self, path, max_entries=100000, timeout=5.0, flush_every=256, flush_interval=5.0,
+                 evict_every=64):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.evict_every = evict_every
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._touched = {}  # key -> last access time, not yet written
+        self._counts = dict.fromkeys(("hits", "misses", "expired"), 0)
+        self._flushed = time.monotonic()
+        self._inserts = 0
+        # WAL has to be switched on outside of a transaction
+        self._connection().execute("PRAGMA journal_mode=WAL")
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT, expires REAL, accessed REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+            conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER)")
+            conn.executemany(
+                "INSERT OR IGNORE INTO stats VALUES (?, 0)",
+                [("hits",), ("misses",), ("evictions",), ("expired",)],
+            )
+
+    def _connection(self):
+        # sqlite3 connections must not cross threads or a fork, so keep one
+        # per (process, thread)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _connect(self):
+        return _Transaction(self._connection())
+
+    def _bump(self, conn, name, n=1):
+        conn.execute("UPDATE stats SET value = value + ? WHERE name = ?", (n, name))
+
+    def _record(self, name, key=None, now=None):
+        with self._lock:
+            self._counts[name] += 1
+            if key is not None:
+                self._touched[key] = now
+            due = (len(self._touched) >= self.flush_every
+                   or time.monotonic() - self._flushed >= self.flush_interval)
+        if not due:
+            return
+        conn = self._connection()
+        # Give up at once if another writer holds the lock; the pending
+        # updates go out with the next flush instead
+        conn.execute("PRAGMA busy_timeout = 0")
+        try:
+            with _Transaction(conn):
+                self._flush(conn)
+        except sqlite3.OperationalError:
+            pass
+        finally:
+            conn.execute(f"PRAGMA busy_timeout = {int(self.timeout * 1000)}")
+
+    def _flush(self, conn):
+        """Write pending access times and counters inside ``conn``'s transaction."""
+        with self._lock:
+            touched, self._touched = self._touched, {}
+            counts = self._counts
+            self._counts = dict.fromkeys(counts, 0)
+            self._flushed = time.monotonic()
+        conn.executemany("UPDATE cache SET accessed = ? WHERE key = ?", [(t, k) for k, t in touched.items()])
+        for name, n in counts.items():
+            if n:
+                self._bump(conn, name, n)
+
+    def get(self, key):
+        now = time.time()
+        # Autocommit read: no write lock, so hits in other workers never wait
+        row = self._connection().execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self._record("misses")
+            return MISSING
+        value, expires = row
+        if expires is not None and expires <= now:
+            # Removed by the next eviction pass
+            self._record("expired")
+            self._record("misses")
+            return MISSING
+        self._record("hits", key, now)
+        return json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        expires = None if ttl is None else now + ttl
+        with self._lock:
+            self._inserts += 1
+            evict = self._inserts % self.evict_every == 0
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), expires, now),
+            )
+            if evict:
+                self._flush(conn)
+                self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM cache WHERE expires <= ?", (now,))
+        (size,) = conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+        excess = size - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM cache WHERE key IN "
+                "(SELECT key FROM cache ORDER BY accessed LIMIT ?)",
+                (excess,),
+            )
+            self._bump(conn, "evictions", excess)
+
+    def delete(self, key):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache")
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def stats(self):
+        with self._connect() as conn:
+            self._flush(conn)
+            stats = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+            stats["size"] = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        return stats
+
+
+class _Transaction:
+    """Wrap a connection in BEGIN IMMEDIATE ... COMMIT for one with-block."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+def make_cache(backend="memory", path=None, max_entries=10000):
+    if backend == "memory":
+        return MemoryCache(max_entries=max_entries)
+    if backend == "sqlite":
+        if path is None:
+            raise ValueError("The sqlite cache backend needs a path")
+        return SQLiteCache(path, max_entries=max_entries)
+    raise ValueError(f"Unknown cache backend: {backend!r}")
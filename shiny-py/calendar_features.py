@@ -0,0 +1,162 @@
+"""Calendar features shared by training, batch scoring and the app.
+
+A ``CalendarTable`` precomputes one row per day (by default 2015-2035) of
+weekday, weekend, US holiday and holiday-proximity features, stored as
+numpy arrays indexed by day number. Single dates are a dict lookup away,
+whole date columns are resolved with one array index.
+"""
+import threading
+from collections import namedtuple
+from datetime import date, datetime
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+WEEKDAY_NAMES = np.array(["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"])
+
+# Peak travel around holidays: two days before through five days after
+HOLIDAY_WINDOW_BEFORE = 2
+HOLIDAY_WINDOW_AFTER = 5
+
+# Distances to the nearest holiday are capped so they fit in int16
+MAX_HOLIDAY_DISTANCE = 366
+
+COLUMNS = ["WEEK", "WEEKDAY", "IS_WEEKEND", "IS_HOLIDAY", "DAYS_TO_HOLIDAY", "DAYS_FROM_HOLIDAY", "HOLIDAY_WINDOW"]
+
+
+# One immutable build of the table; swapped in whole when the range widens
+_Days = namedtuple("_Days", [
+    "start_year", "end_year", "start", "weekday", "is_weekend", "is_holiday",
+    "days_to", "days_from", "holiday_window", "names",
+])
+
+
+class CalendarTable:
+    """Per-day calendar features for a range of years.
+
+    Dates outside the range extend the table on first use, so callers never
+    see a miss. Each lookup reads one snapshot of the arrays, so a table
+    being widened by another thread is never seen half-built.
+    """
+
+    def __init__(self, start_year=2015, end_year=2035):
+        self._lock = threading.Lock()
+        self._days = self._build(start_year, end_year)
+
+    @staticmethod
+    def _build(start_year, end_year):
+        import holidays
+
+        start = np.datetime64(f"{start_year}-01-01", "D")
+        days = np.arange(start, np.datetime64(f"{end_year + 1}-01-01", "D"))
+        # One year of margin either side so proximity is right at the edges
+        observed = holidays.US(years=range(start_year - 1, end_year + 2))
+        hol = np.array(sorted(observed), dtype="datetime64[D]")
+
+        weekday = ((days - np.datetime64("1970-01-05", "D")).astype(np.int64) % 7).astype(np.int8)
+        nxt = np.searchsorted(hol, days, side="left")
+        prev = np.searchsorted(hol, days, side="right") - 1
+        days_to = (hol[np.minimum(nxt, len(hol) - 1)] - days).astype(np.int64)
+        days_from = (days - hol[np.maximum(prev, 0)]).astype(np.int64)
+
+        days_to = np.clip(days_to, 0, MAX_HOLIDAY_DISTANCE).astype(np.int16)
+        days_from = np.clip(days_from, 0, MAX_HOLIDAY_DISTANCE).astype(np.int16)
+        window = (days_to <= HOLIDAY_WINDOW_BEFORE) | (days_from <= HOLIDAY_WINDOW_AFTER)
+        return _Days(
+            start_year=start_year,
+            end_year=end_year,
+            start=start,
+            weekday=weekday,
+            is_weekend=(weekday >= 5).astype(np.int8),
+            is_holiday=(days_to == 0).astype(np.int8),
+            days_to=days_to,
+            days_from=days_from,
+            holiday_window=window.astype(np.int8),
+            names={np.datetime64(d, "D"): name for d, name in observed.items()},
+        )
+
+    def _ensure(self, first, last):
+        """Snapshot covering the years of ``first`` and ``last`` (datetime64[D]), widening if needed."""
+        lo = int(str(first)[:4])
+        hi = int(str(last)[:4])
+        t = self._days
+        if lo >= t.start_year and hi <= t.end_year:
+            return t
+        with self._lock:
+            t = self._days
+            if lo < t.start_year or hi > t.end_year:
+                t = self._build(min(lo, t.start_year), max(hi, t.end_year))
+                self._days = t
+            return t
+
+    def features(self, day):
+        """Calendar features of one date (date, datetime or YYYY-MM-DD) as a dict."""
+        if isinstance(day, datetime):
+            day = day.date()
+        elif not isinstance(day, date):
+            day = datetime.strptime(str(day), "%Y-%m-%d").date()
+        d = np.datetime64(day, "D")
+        t = self._ensure(d, d)
+        i = int((d - t.start).astype(np.int64))
+        return {
+            "WEEK": str(WEEKDAY_NAMES[t.weekday[i]]),
+            "WEEKDAY": int(t.weekday[i]),
+            "IS_WEEKEND": int(t.is_weekend[i]),
+            "IS_HOLIDAY": int(t.is_holiday[i]),
+            "DAYS_TO_HOLIDAY": int(t.days_to[i]),
+            "DAYS_FROM_HOLIDAY": int(t.days_from[i]),
+            "HOLIDAY_WINDOW": int(t.holiday_window[i]),
+        }
+
+    def lookup(self, dates):
+        """Calendar features for a column of dates, one row per input.
+
+        Unparseable or missing dates get NaN/None features. The result keeps
+        the index of a Series input.
+        """
+        index = dates.index if isinstance(dates, pd.Series) else None
+        values = pd.to_datetime(pd.Series(dates), errors="coerce").to_numpy().astype("datetime64[D]")
+        valid = ~np.isnat(values)
+        t = self._ensure(values[valid].min(), values[valid].max()) if valid.any() else self._days
+        pos = np.where(valid, (values - t.start).astype(np.int64), 0)
+
+        out = pd.DataFrame({
+            "WEEK": WEEKDAY_NAMES[t.weekday[pos]],
+            "WEEKDAY": t.weekday[pos],
+            "IS_WEEKEND": t.is_weekend[pos],
+            "IS_HOLIDAY": t.is_holiday[pos],
+            "DAYS_TO_HOLIDAY": t.days_to[pos],
+            "DAYS_FROM_HOLIDAY": t.days_from[pos],
+            "HOLIDAY_WINDOW": t.holiday_window[pos],
+        }, index=index)
+        if not valid.all():
+            out = out.astype({col: float for col in COLUMNS if col != "WEEK"}).astype({"WEEK": object})
+            out.loc[~valid, :] = None
+        return out
+
+    def holiday_name(self, day):
+        return self._days.names.get(np.datetime64(pd.Timestamp(day).date(), "D"))
+
+
+@lru_cache(maxsize=1)
+def get_calendar():
+    """Process-wide calendar table."""
+    return CalendarTable()
+
+
+def calendar_features(dates):
+    """``get_calendar().lookup`` for columns, ``.features`` for single dates."""
+    if isinstance(dates, (pd.Series, pd.Index, np.ndarray, list)):
+        return get_calendar().lookup(dates)
+    return get_calendar().features(dates)
+
+
+def hhmm(hour, minute):
+    """Clock time in the BTS hhmm encoding the models were trained on (08:30 -> 830)."""
+    return hour * 100 + minute
+
+
+def hour_of(hhmm_time):
+    """DEP_HOUR/ARR_HOUR exactly as training derives them."""
+    return hhmm_time // 100
@@ -0,0 +1,477 @@
+"""Near-real-time airport and carrier congestion from a stream of flight events.
+
+Each event is one flight status update: a JSON object (or CSV row) with
+the time, ORIGIN_IATA, DEST_IATA, MKT_AIRLINE, DEP_DELAY, ARR_DELAY,
+CANCELLED, and optionally NAS_DELAY and LATE_AIRCRAFT_DELAY. BTS column
+names such as ORIGIN/DEST or FL_DATE plus DEP_TIME are accepted too.
+``CongestionStore`` keeps one ``RollingWindow`` per departure airport,
+arrival airport and carrier. A window is a ring of per-minute buckets with
+running totals for the last hour and the last three hours, so updates and
+lookups cost the same however long the stream has been running.
+
+Feeds:
+
+* CONGESTION_FEED=events.jsonl replays a file and then follows it as new
+  lines are appended.
+* CONGESTION_LISTEN=127.0.0.1:9009 accepts newline-delimited JSON events
+  over TCP.
+
+Under serve.py the parent runs the feeds and forwards every event to the
+workers (see WorkerFanout), so the port is bound once.
+
+    python congestion.py replay events.jsonl --to 127.0.0.1:9009 --speed 60
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Window lengths in minutes and their feature suffixes
+WINDOWS = {60: "1H", 180: "3H"}
+
+# Per-bucket sums kept for every window
+FIELDS = ["FLIGHTS", "CANCELLED", "DELAY_N", "DELAY_SUM", "NAS_DELAY_N", "NAS_DELAY_SUM",
+          "LATE_AIRCRAFT_DELAY_N", "LATE_AIRCRAFT_DELAY_SUM"]
+_F = {name: i for i, name in enumerate(FIELDS)}
+
+# (feature prefix, store scope, the delay the scope averages)
+SCOPES = [("ORIGIN", "dep", "DEP_DELAY"), ("DEST", "arr", "ARR_DELAY"), ("CARRIER", "carrier", "DEP_DELAY")]
+
+CONGESTION_FEATURES = [
+    f"{prefix}_{name}_{suffix}"
+    for prefix, _, _ in SCOPES
+    for suffix in WINDOWS.values()
+    for name in ("FLIGHTS", "CANCELLED", "DELAY", "NAS_DELAY", "LATE_AIRCRAFT_DELAY")
+]
+
+# Congestion now says little about flights further out than this
+HORIZON_HOURS = float(os.environ.get("CONGESTION_HORIZON_HOURS", 6))
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _minute(when):
+    return (when - _EPOCH) // timedelta(minutes=1)
+
+
+class RollingWindow:
+    """Per-minute buckets with running totals over several trailing windows.
+
+    ``add`` and ``totals`` are O(1) amortized: moving the clock forward
+    retires at most one bucket per elapsed minute, and never more than the
+    ring holds.
+    """
+
+    __slots__ = ("size", "buckets", "totals", "minute")
+
+    def __init__(self, windows=tuple(WINDOWS)):
+        self.size = max(windows)
+        self.buckets = np.zeros((self.size, len(FIELDS)))
+        self.totals = {w: np.zeros(len(FIELDS)) for w in windows}
+        self.minute = None
+
+    def advance(self, minute):
+        if self.minute is None:
+            self.minute = minute
+            return
+        if minute - self.minute >= self.size:
+            self.buckets[:] = 0
+            for total in self.totals.values():
+                total[:] = 0
+        else:
+            for m in range(self.minute + 1, minute + 1):
+                # Minute m enters every window; minute m - w leaves window w
+                for w, total in self.totals.items():
+                    total -= self.buckets[(m - w) % self.size]
+                self.buckets[m % self.size] = 0
+        self.minute = max(self.minute, minute)
+
+    def add(self, minute, values):
+        self.advance(minute)
+        if minute <= self.minute - self.size:
+            return  # older than the longest window
+        self.buckets[minute % self.size] += values
+        for w, total in self.totals.items():
+            if minute > self.minute - w:
+                total += values
+
+    def totals_at(self, minute):
+        self.advance(minute)
+        return self.totals
+
+
+class CongestionStore:
+    """Rolling per-airport and per-carrier congestion, fed one event at a time."""
+
+    def __init__(self):
+        self._windows = {}  # (scope, code) -> RollingWindow
+        self._lock = threading.Lock()
+        self.clock = None  # latest event time seen
+        self.events = 0
+
+    def __len__(self):
+        return self.events
+
+    def update(self, event):
+        """Fold one event (dict) into the windows. Returns False if unusable."""
+        parsed = parse_event(event)
+        if parsed is None:
+            return False
+        when, origin, dest, carrier, dep_delay, arr_delay, values = parsed
+        minute = _minute(when)
+        delays = {"DEP_DELAY": dep_delay, "ARR_DELAY": arr_delay}
+        with self._lock:
+            for (_, scope, delay_col), code in zip(SCOPES, (origin, dest, carrier)):
+                if not code:
+                    continue
+                window = self._windows.get((scope, code))
+                if window is None:
+                    window = self._windows[(scope, code)] = RollingWindow()
+                row = values.copy()
+                if delays[delay_col] is not None:
+                    row[_F["DELAY_N"]] = 1
+                    row[_F["DELAY_SUM"]] = delays[delay_col]
+                window.add(minute, row)
+            self.events += 1
+            if self.clock is None or when > self.clock:
+                self.clock = when
+        return True
+
+    def _scope_features(self, prefix, scope, code, minute):
+        window = self._windows.get((scope, code))
+        out = {}
+        for w, suffix in WINDOWS.items():
+            total = window.totals_at(minute)[w] if window is not None else np.zeros(len(FIELDS))
+            out[f"{prefix}_FLIGHTS_{suffix}"] = float(total[_F["FLIGHTS"]])
+            out[f"{prefix}_CANCELLED_{suffix}"] = float(total[_F["CANCELLED"]])
+            # Means over the flights that reported each delay; None when none did
+            for name in ("DELAY", "NAS_DELAY", "LATE_AIRCRAFT_DELAY"):
+                n = total[_F[f"{name}_N"]]
+                out[f"{prefix}_{name}_{suffix}"] = float(total[_F[f"{name}_SUM"]] / n) if n else None
+        return out
+
+    def features(self, origin, dest, carrier, now=None):
+        """Congestion features for one flight as a dict (see CONGESTION_FEATURES)."""
+        with self._lock:
+            minute = _minute(now or self.clock or datetime.now())
+            out = {}
+            for (prefix, scope, _), code in zip(SCOPES, (origin, dest, carrier)):
+                out.update(self._scope_features(prefix, scope, str(code).strip().upper(), minute))
+        return out
+
+    def lookup(self, origins, dests, carriers, now=None):
+        """CONGESTION_FEATURES for columns of flights; each distinct key is read once."""
+        index = origins.index if isinstance(origins, pd.Series) else None
+        with self._lock:
+            minute = _minute(now or self.clock or datetime.now())
+            columns = {}
+            for (prefix, scope, _), codes in zip(SCOPES, (origins, dests, carriers)):
+                codes = pd.Series(codes, index=index).astype("string").str.strip().str.upper()
+                per_code = {code: self._scope_features(prefix, scope, code, minute)
+                            for code in codes.dropna().unique()}
+                table = pd.DataFrame.from_dict(per_code, orient="index")
+                if table.empty:
+                    table = pd.DataFrame(columns=self._scope_features(prefix, scope, None, minute).keys())
+                columns[prefix] = table.reindex(codes.to_numpy()).set_axis(codes.index)
+        frame = pd.concat(columns.values(), axis=1)
+        return frame[CONGESTION_FEATURES].astype(float)
+
+    def near(self, departure):
+        """Whether current congestion is worth joining for this departure time."""
+        if not self.events:
+            return False
+        hours = (departure - self.clock).total_seconds() / 3600
+        return -1 <= hours <= HORIZON_HOURS
+
+    def attach(self, features, departures):
+        """Add CONGESTION_FEATURES to ``features`` for flights departing within HORIZON_HOURS.
+
+        ``departures`` holds each row's scheduled departure (datetime64).
+        Other rows, and every row while no events have arrived, get NaN.
+        """
+        for col in CONGESTION_FEATURES:
+            features[col] = np.nan
+        if not self.events:
+            return features
+        now = self.clock
+        ahead = (departures - pd.Timestamp(now)) / pd.Timedelta(hours=1)
+        near = (ahead >= -1) & (ahead <= HORIZON_HOURS)
+        if near.any():
+            rows = features.loc[near.to_numpy()]
+            features.loc[near.to_numpy(), CONGESTION_FEATURES] = self.lookup(
+                rows["ORIGIN_IATA"], rows["DEST_IATA"], rows["MKT_AIRLINE"], now=now
+            ).to_numpy()
+        return features
+
+
+def _number(value):
+    if value is None or value == "":
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if np.isnan(value) else value
+
+
+def _event_time(event):
+    if event.get("time"):
+        return datetime.fromisoformat(str(event["time"]).replace("Z", "")).replace(tzinfo=None)
+    day = event.get("FL_DATE") or event.get("DATE")
+    clock = _number(event.get("DEP_TIME") or event.get("SCH_DEP_TIME") or event.get("CRS_DEP_TIME"))
+    if not day or clock is None:
+        return None
+    clock = int(clock) % 2400
+    return datetime.fromisoformat(str(day)[:10]) + timedelta(hours=clock // 100, minutes=clock % 100)
+
+
+def _code(event, *keys):
+    return next((str(event[k]).strip().upper() for k in keys if event.get(k)), None)
+
+
+def parse_event(event):
+    """(time, origin, dest, carrier, dep_delay, arr_delay, values) or None."""
+    try:
+        when = _event_time(event)
+    except ValueError:
+        return None
+    if when is None:
+        return None
+    values = np.zeros(len(FIELDS))
+    values[_F["FLIGHTS"]] = 1
+    values[_F["CANCELLED"]] = 1 if _number(event.get("CANCELLED")) else 0
+    for name in ("NAS_DELAY", "LATE_AIRCRAFT_DELAY"):
+        value = _number(event.get(name))
+        if value is not None:
+            values[_F[f"{name}_N"]] = 1
+            values[_F[f"{name}_SUM"]] = value
+    return (when, _code(event, "ORIGIN_IATA", "ORIGIN"), _code(event, "DEST_IATA", "DEST"),
+            _code(event, "MKT_AIRLINE", "OP_UNIQUE_CARRIER", "CARRIER"),
+            _number(event.get("DEP_DELAY")), _number(event.get("ARR_DELAY")), values)
+
+
+def read_events(path, follow=False, poll=1.0):
+    """Yield events from a JSON-lines or CSV file; with ``follow``, keep tailing it."""
+    path = Path(path)
+    with open(path, newline="") as f:
+        if path.suffix == ".csv":
+            yield from csv.DictReader(f)
+            return
+        while True:
+            line = f.readline()
+            if not line:
+                if not follow:
+                    return
+                time.sleep(poll)
+                continue
+            line = line.strip()
+            if line:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping malformed event line: {line[:80]}")
+
+
+def replay(events, sink, speed=None):
+    """Send ``events`` to ``sink`` in order, paced ``speed`` times faster than real time."""
+    first_event = first_wall = None
+    for event in events:
+        if speed:
+            parsed = parse_event(event)
+            if parsed is not None:
+                if first_event is None:
+                    first_event, first_wall = parsed[0], time.monotonic()
+                wait = (parsed[0] - first_event).total_seconds() / speed - (time.monotonic() - first_wall)
+                if wait > 0:
+                    time.sleep(wait)
+        sink(event)
+
+
+class _EventHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                self.server.sink(json.loads(line))
+            except (json.JSONDecodeError, AttributeError):
+                logger.warning("Skipping malformed event from socket")
+
+
+def listen(sink, host, port):
+    """Accept newline-delimited JSON events over TCP on a daemon thread.
+
+    Each event is passed to ``sink`` (e.g. ``store.update``). Raises
+    OSError if the address cannot be bound.
+    """
+    server = socketserver.ThreadingTCPServer((host, port), _EventHandler)
+    server.daemon_threads = True
+    server.sink = sink
+    threading.Thread(target=server.serve_forever, name="congestion-listen", daemon=True).start()
+    logger.info(f"Listening for congestion events on {host}:{port}")
+    return server
+
+
+def start_feeds(sink):
+    """Start the feeds configured by CONGESTION_FEED / CONGESTION_LISTEN.
+
+    Returns the TCP server, or None when there is none. A listener that
+    cannot bind is logged and skipped, so predictions go on without it.
+    """
+    feed = os.environ.get("CONGESTION_FEED")
+    if feed:
+        speed = _number(os.environ.get("CONGESTION_REPLAY_SPEED"))
+        threading.Thread(
+            target=lambda: replay(read_events(feed, follow=True), sink, speed),
+            name="congestion-feed", daemon=True,
+        ).start()
+        logger.info(f"Following congestion events from {feed}")
+    address = os.environ.get("CONGESTION_LISTEN")
+    if not address:
+        return None
+    host, _, port = address.rpartition(":")
+    try:
+        return listen(sink, host or "127.0.0.1", int(port))
+    except OSError as e:
+        logger.error(f"Could not listen for congestion events on {address}: {str(e)}")
+        return None
+
+
+class WorkerFanout:
+    """Feeds owned by a pre-forking parent and copied to its workers.
+
+    serve.py starts the feeds once, before forking. ``fork`` hands each
+    worker a snapshot of the parent's store plus a pipe that carries every
+    later event, so all workers see the same stream from one listener.
+    """
+
+    def __init__(self):
+        self.store = CongestionStore()
+        self._pipes = {}  # worker pid -> write end
+        self._lock = threading.Lock()
+        self.server = start_feeds(self.update)
+
+    def update(self, event):
+        line = (json.dumps(event) + "\n").encode()
+        # Applying and forwarding under one lock means a fork lands either
+        # before the event (the worker gets it by pipe) or after (in its copy)
+        with self._lock:
+            if not self.store.update(event):
+                return False
+            for pid, fd in list(self._pipes.items()):
+                try:
+                    os.write(fd, line)
+                except BlockingIOError:
+                    logger.warning(f"Worker {pid} is not keeping up with congestion events, dropped one")
+                except OSError:
+                    # The worker is gone
+                    os.close(fd)
+                    del self._pipes[pid]
+        return True
+
+    def fork(self):
+        """``os.fork()`` for a worker; in the child, starts following the parent's events."""
+        read_fd, write_fd = os.pipe()
+        os.set_blocking(write_fd, False)
+        # Holding both locks keeps the store consistent in the child's copy,
+        # and registering the pipe under them means no event published after
+        # the fork can miss the new worker
+        with self._lock, self.store._lock:
+            pid = os.fork()
+            if pid:
+                self._pipes[pid] = write_fd
+        if pid:
+            os.close(read_fd)
+            return pid
+        os.close(write_fd)
+        for fd in self._pipes.values():
+            os.close(fd)
+        self._pipes.clear()
+        if self.server is not None:
+            self.server.socket.close()
+            self.server = None
+        threading.Thread(target=self._follow, args=(read_fd,), name="congestion-worker", daemon=True).start()
+        return 0
+
+    def _follow(self, fd):
+        with os.fdopen(fd, "rb") as pipe:
+            for line in pipe:
+                self.store.update(json.loads(line))
+
+
+# Set by share_feeds() in a pre-forking parent; its workers use that store
+_fanout = None
+
+
+def share_feeds():
+    """Start the configured feeds in this (parent) process for forked workers.
+
+    Returns the WorkerFanout whose ``fork`` serve.py uses, or None when no
+    feed is configured.
+    """
+    global _fanout
+    if _fanout is None and (os.environ.get("CONGESTION_FEED") or os.environ.get("CONGESTION_LISTEN")):
+        _fanout = WorkerFanout()
+    return _fanout
+
+
+def get_store():
+    """Process-wide store, or None when no feed is configured.
+
+    Without share_feeds(), the feeds start on first use in this process.
+    """
+    if _fanout is not None:
+        return _fanout.store
+    return _own_store()
+
+
+@lru_cache(maxsize=1)
+def _own_store():
+    if not (os.environ.get("CONGESTION_FEED") or os.environ.get("CONGESTION_LISTEN")):
+        return None
+    store = CongestionStore()
+    start_feeds(store.update)
+    return store
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay flight status events into a congestion store.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rep = sub.add_parser("replay", help="send a JSONL/CSV file of events to a listening app")
+    rep.add_argument("events")
+    rep.add_argument("--to", default="127.0.0.1:9009", help="host:port of CONGESTION_LISTEN")
+    rep.add_argument("--speed", type=float, default=None, help="times faster than real time (default: no pacing)")
+    show = sub.add_parser("show", help="replay a file locally and print one flight's features")
+    show.add_argument("events")
+    show.add_argument("origin")
+    show.add_argument("dest")
+    show.add_argument("carrier")
+    args = parser.parse_args(argv)
+
+    if args.command == "replay":
+        host, _, port = args.to.rpartition(":")
+        with socket.create_connection((host, int(port))) as conn:
+            replay(read_events(args.events), lambda e: conn.sendall((json.dumps(e) + "\n").encode()), args.speed)
+        return
+    store = CongestionStore()
+    start = time.perf_counter()
+    for event in read_events(args.events):
+        store.update(event)
+    print(f"{len(store)} events in {time.perf_counter() - start:.2f}s, clock {store.clock}")
+    for name, value in store.features(args.origin, args.dest, args.carrier).items():
+        print(f"  {name:<32} {value:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""Timing spans, counters and a Prometheus text exposition for the hot path.
+
+    with request_trace("predict_flight"):
+        with span("weather_fetch"):
+            ...
+        inc("predictions_total", model_set="weather")
+
+Spans feed a ``flight_stage_seconds`` histogram per stage and are also
+collected per request; requests slower than METRICS_SLOW_MS are logged as
+one JSON line with their spans. With METRICS_PROFILE_RATE > 0 that
+fraction of requests runs under cProfile and is dumped to
+METRICS_PROFILE_DIR. METRICS_ENABLED=0 turns everything into no-ops that
+cost one attribute check.
+
+Counters and histograms are per process. With METRICS_DIR set (serve.py
+sets it for its workers), each process also writes them to
+``<METRICS_DIR>/<pid>.json`` about once a second, and ``render`` sums the
+files of every process, so a scrape of any worker reports the whole
+server. Gauges from collectors describe the answering process and carry
+a ``worker`` label with its pid.
+"""
+import atexit
+import contextvars
+import cProfile
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+SLOW_MS = float(os.environ.get("METRICS_SLOW_MS", 1000))
+PROFILE_RATE = float(os.environ.get("METRICS_PROFILE_RATE", 0))
+PROFILE_DIR = Path(os.environ.get("METRICS_PROFILE_DIR", Path(__file__).parent / "profiles"))
+MULTIPROCESS_DIR = os.environ.get("METRICS_DIR")
+# Seconds between snapshot writes in multi-process mode
+WRITE_INTERVAL = 1.0
+
+# Histogram buckets in seconds, from cache hits up to slow upstream calls
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_counters = {}  # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+_collectors = []
+_trace = contextvars.ContextVar("metrics_trace", default=None)
+_writer = None  # snapshot thread of this process, in multi-process mode
+_dirty = False
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """Add ``value`` to counter ``name`` with the given labels."""
+    if not ENABLED:
+        return
+    global _dirty
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+        _dirty = True
+    if MULTIPROCESS_DIR and _writer is None:
+        _start_writer()
+
+
+def observe(name, seconds, **labels):
+    """Record one duration in histogram ``name``."""
+    if not ENABLED:
+        return
+    global _dirty
+    key = (name, _labels(labels))
+    if MULTIPROCESS_DIR and _writer is None:
+        _start_writer()
+    with _lock:
+        _dirty = True
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                hist[i] += 1
+                break
+        hist[-2] += seconds
+        hist[-1] += 1
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _Span:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        observe("flight_stage_seconds", elapsed, stage=self.stage)
+        trace = _trace.get()
+        if trace is not None:
+            trace.append((self.stage, round(elapsed * 1000, 3)))
+        return False
+
+
+def span(stage):
+    """Context manager timing one stage of the current request."""
+    return _Span(stage) if ENABLED else _NO_SPAN
+
+
+@contextmanager
+def request_trace(name):
+    """Collect the spans of one request; log slow ones, sometimes profile."""
+    if not ENABLED:
+        yield
+        return
+    spans = []
+    token = _trace.set(spans)
+    profiler = cProfile.Profile() if PROFILE_RATE and random.random() < PROFILE_RATE else None
+    start = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if profiler:
+            profiler.disable()
+            _dump_profile(profiler, name)
+        _trace.reset(token)
+        observe("flight_request_seconds", elapsed, endpoint=name)
+        inc("flight_requests_total", endpoint=name)
+        if elapsed * 1000 >= SLOW_MS:
+            logger.warning(json.dumps({"slow_request": name, "ms": round(elapsed * 1000, 3), "spans": spans}))
+
+
+def _dump_profile(profiler, name):
+    try:
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        path = PROFILE_DIR / f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{random.getrandbits(16):04x}.prof"
+        profiler.dump_stats(path)
+    except OSError as e:
+        logger.warning(f"Could not write profile: {str(e)}")
+
+
+def _start_writer():
+    global _writer
+    with _lock:
+        if _writer is not None:
+            return
+        _writer = threading.Thread(target=_write_loop, name="metrics-writer", daemon=True)
+    _writer.start()
+
+
+def _write_loop():
+    while True:
+        time.sleep(WRITE_INTERVAL)
+        _write_snapshot()
+
+
+def _write_snapshot(force=False):
+    """Write this process's counters and histograms to MULTIPROCESS_DIR."""
+    global _dirty
+    with _lock:
+        if not (_dirty or force):
+            return
+        _dirty = False
+        snapshot = {
+            "counters": [[n, labels, v] for (n, labels), v in _counters.items()],
+            "histograms": [[n, labels, h] for (n, labels), h in _histograms.items()],
+        }
+    path = Path(MULTIPROCESS_DIR) / f"{os.getpid()}.json"
+    tmp = path.with_suffix(".tmp")
+    try:
+        tmp.write_text(json.dumps(snapshot))
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning(f"Could not write metrics snapshot: {str(e)}")
+
+
+def _after_fork_in_child():
+    # Counts from before the fork belong to the parent's snapshot
+    global _writer, _dirty
+    _lock.release()
+    _counters.clear()
+    _histograms.clear()
+    _writer = None
+    _dirty = False
+
+
+if MULTIPROCESS_DIR:
+    os.register_at_fork(before=_lock.acquire, after_in_parent=_lock.release, after_in_child=_after_fork_in_child)
+    atexit.register(_write_snapshot)
+
+
+def _merged():
+    """Counters and histograms summed over every process's snapshot."""
+    _write_snapshot(force=True)
+    counters, histograms = {}, {}
+    for path in Path(MULTIPROCESS_DIR).glob("*.json"):
+        try:
+            snapshot = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue  # being replaced right now; it is picked up next scrape
+        for name, labels, value in snapshot["counters"]:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, hist in snapshot["histograms"]:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            total = histograms.setdefault(key, [0] * len(hist))
+            for i, v in enumerate(hist):
+                total[i] += v
+    return counters, histograms
+
+
+def register_collector(fn):
+    """``fn()`` returns [(name, labels dict, value)] read at scrape time.
+
+    Used for numbers other components already keep, such as cache stats.
+    """
+    _collectors.append(fn)
+    return fn
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in labels) + "}"
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    if MULTIPROCESS_DIR:
+        counters, histograms = _merged()
+    else:
+        with _lock:
+            counters = dict(_counters)
+            histograms = {k: list(v) for k, v in _histograms.items()}
+    lines = []
+    for name in sorted({n for n, _ in counters}):
+        lines.append(f"# TYPE {name} counter")
+        for (n, labels), value in sorted(counters.items()):
+            if n == name:
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+    for name in sorted({n for n, _ in histograms}):
+        lines.append(f"# TYPE {name} histogram")
+        for (n, labels), hist in sorted(histograms.items()):
+            if n != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS, hist):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {hist[-1]}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {hist[-2]}")
+            lines.append(f"{name}_count{_format_labels(labels)} {hist[-1]}")
+    gauges = {}
+    for collector in _collectors:
+        try:
+            for name, labels, value in collector():
+                if MULTIPROCESS_DIR:
+                    labels = dict(labels, worker=os.getpid())
+                gauges.setdefault(name, []).append((_labels(labels), value))
+        except Exception as e:
+            logger.warning(f"Metrics collector failed: {str(e)}")
+    for name, samples in sorted(gauges.items()):
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in samples:
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
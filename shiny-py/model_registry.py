@@ -0,0 +1,207 @@
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+import joblib
+
+logger = logging.getLogger(__name__)
+
+MODEL_DIR = Path(__file__).parent / "model"
+
+MODEL_FILES = {
+    "weather": {
+        "cancel": "pipe_cancel_weather.pkl",
+        "dep": "pipe_dep_weather.pkl",
+        "arr": "pipe_arr_weather.pkl",
+    },
+    "no_weather": {
+        "cancel": "pipe_cancel_no_weather.pkl",
+        "dep": "pipe_dep_no_weather.pkl",
+        "arr": "pipe_arr_no_weather.pkl",
+    },
+}
+
+
+class ModelRegistry:
+    """Loads each pipeline on first use and can swap in new versions live.
+
+    ``registry["weather"]["cancel"]`` loads only that pickle. A model
+    directory may contain a ``VERSION`` file; otherwise the version is
+    derived from the pickle timestamps. When ``check_interval`` is set, the
+    directory is re-checked at most that often and changed models are
+    dropped so the next request loads the new files.
+
+    With ``compiled`` the registry serves ``CompiledPipeline`` objects,
+    read from ``<model_dir>/compiled`` when exported there and otherwise
+    compiled from the pickle at load time.
+    """
+
+    def __init__(self, model_dir=MODEL_DIR, files=MODEL_FILES, mmap_mode=None, check_interval=None,
+                 compiled=False):
+        self.model_dir = Path(model_dir)
+        self.files = files
+        self.compiled = compiled
+        # Passed through to joblib.load: numpy arrays in uncompressed pickles
+        # are then mapped from the page cache and shared between processes
+        self.mmap_mode = mmap_mode
+        self.check_interval = check_interval
+        self._models = {}
+        self._lock = threading.RLock()
+        self._version = self._read_version()
+        self._last_check = time.monotonic()
+
+    def __getitem__(self, model_set):
+        return _ModelSet(self, model_set)
+
+    def get(self, model_set, name):
+        self._maybe_refresh()
+        key = (model_set, name)
+        model = self._models.get(key)
+        if model is None:
+            # The version this load is for; see _still_current
+            version = self._version
+            with self._lock:
+                model = self._models.get(key)
+                if model is None:
+                    model = self._load(model_set, name)
+                    if self._still_current(version, key):
+                        self._models[key] = model
+        return model
+
+    def _still_current(self, version, key):
+        """Whether a load started at ``version`` may be cached.
+
+        A refresh or swap that landed while it was loading means the pickle
+        may be from either side of the change, so it serves this one call
+        and the next one loads again.
+        """
+        if self._version == version:
+            return True
+        logger.info(f"Models changed to version {self._version} while loading {key} for {version}, not caching it")
+        return False
+
+    def _load(self, model_set, name):
+        path = self.model_dir / self.files[model_set][name]
+        start = time.perf_counter()
+        try:
+            if self.compiled:
+                model = self._load_compiled(path)
+            else:
+                model = joblib.load(path, mmap_mode=self.mmap_mode)
+        except Exception as e:
+            logger.error(f"Error loading {model_set}/{name} model from {path}: {str(e)}")
+            raise
+        logger.info(f"Loaded {model_set}/{name} model in {time.perf_counter() - start:.2f}s")
+        return model
+
+    def _load_compiled(self, path):
+        from compiled_model import CompiledPipeline, compile_pipeline
+
+        exported = self.model_dir / "compiled" / path.stem
+        if exported.exists():
+            return CompiledPipeline.load(exported)
+        return compile_pipeline(joblib.load(path, mmap_mode=self.mmap_mode))
+
+    def fused(self, model_set):
+        """FusedPredictor over the cancel/dep/arr models of one model set."""
+        self._maybe_refresh()
+        key = (model_set, "fused")
+        predictor = self._models.get(key)
+        if predictor is None:
+            from compiled_model import FusedPredictor, compile_pipeline
+
+            version = self._version
+            with self._lock:
+                predictor = self._models.get(key)
+                if predictor is None:
+                    parts = [self.get(model_set, name) for name in ("cancel", "dep", "arr")]
+                    if not self.compiled:
+                        parts = [compile_pipeline(p) for p in parts]
+                    predictor = FusedPredictor(*parts)
+                    if self._still_current(version, key):
+                        self._models[key] = predictor
+        return predictor
+
+    def warm_up(self, model_sets=None):
+        """Load everything up front (or just the given model sets)."""
+        for model_set in model_sets or self.files:
+            for name in self.files[model_set]:
+                self.get(model_set, name)
+        return self
+
+    def loaded(self):
+        return sorted(self._models)
+
+    @property
+    def version(self):
+        return self._version
+
+    def _read_version(self):
+        version_file = self.model_dir / "VERSION"
+        if version_file.exists():
+            return version_file.read_text().strip()
+        mtimes = [
+            os.stat(self.model_dir / fname).st_mtime_ns
+            for files in self.files.values() for fname in files.values()
+            if (self.model_dir / fname).exists()
+        ]
+        return str(max(mtimes, default=0))
+
+    def _maybe_refresh(self):
+        if self.check_interval is None:
+            return
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        version = self._read_version()
+        if version != self._version:
+            logger.info(f"Model version changed {self._version} -> {version}, reloading")
+            self._reset(version)
+
+    def swap(self, model_dir, warm=True):
+        """Point the registry at a new model directory without a restart.
+
+        With ``warm`` the new pipelines are loaded before the switch, so
+        requests keep being served by the old ones until then.
+        """
+        new = ModelRegistry(model_dir, self.files, self.mmap_mode, compiled=self.compiled)
+        if warm:
+            new.warm_up()
+        with self._lock:
+            self.model_dir = new.model_dir
+            self._models = dict(new._models)
+            self._version = new._version
+        logger.info(f"Swapped models to {self.model_dir} (version {self._version})")
+
+    def _reset(self, version):
+        with self._lock:
+            self._models = {}
+            self._version = version
+
+
+class _ModelSet:
+    """Dict-like view so callers can keep writing ``models[set][name]``."""
+
+    def __init__(self, registry, model_set):
+        self.registry = registry
+        self.model_set = model_set
+
+    def __getitem__(self, name):
+        return self.registry.get(self.model_set, name)
+
+
+def registry_from_env():
+    """Build the app's registry from MODEL_* environment variables."""
+    interval = os.environ.get("MODEL_CHECK_INTERVAL")
+    registry = ModelRegistry(
+        os.environ.get("MODEL_DIR", MODEL_DIR),
+        mmap_mode=os.environ.get("MODEL_MMAP_MODE") or None,
+        check_interval=float(interval) if interval else None,
+        compiled=os.environ.get("MODEL_COMPILED", "0") == "1",
+    )
+    if os.environ.get("MODEL_EAGER_LOAD", "0") == "1":
+        registry.warm_up()
+    return registry
@@ -0,0 +1,65 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+from cache_backend import MISSING, make_cache
+from metrics import inc
+
+
+class PredictionCache:
+    """Final cancel/delay predictions keyed on the normalized feature row.
+
+    The key covers the model set, the registry's model version and every
+    feature the fused predictor reads, so swapping models or getting fresh
+    weather values naturally misses. Any backend from ``cache_backend``
+    works; the SQLite one shares results between workers.
+    """
+
+    def __init__(self, backend, ttl=900):
+        self.backend = backend
+        self.ttl = ttl
+
+    def key(self, model_set, version, row, feature_names):
+        values = [_normalize(row[name]) for name in feature_names]
+        raw = json.dumps([model_set, version, values], separators=(",", ":"))
+        return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+    def predict(self, registry, model_set, row):
+        """Cached equivalent of ``registry.fused(model_set).predict(row)``.
+
+        Returns a dict of floats: cancel_prob, dep_delay and arr_delay.
+        """
+        predictor = registry.fused(model_set)
+        key = self.key(model_set, registry.version, row, predictor.feature_names_in_)
+        cached = self.backend.get(key)
+        if cached is not MISSING:
+            inc("prediction_cache_lookups_total", result="hit")
+            return cached
+        inc("prediction_cache_lookups_total", result="miss")
+        predicted = {name: float(values[0]) for name, values in predictor.predict(row).items()}
+        self.backend.set(key, predicted, ttl=self.ttl)
+        return predicted
+
+    def stats(self):
+        stats = self.backend.stats()
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+def _normalize(value):
+    # numpy scalars and ints/floats that compare equal must hash the same
+    if isinstance(value, (np.integer, np.floating, int, float)) and not isinstance(value, bool):
+        return round(float(value), 6)
+    return value
+
+
+def prediction_cache_from_env():
+    backend = make_cache(
+        os.environ.get("PREDICTION_CACHE_BACKEND", "memory"),
+        path=os.environ.get("PREDICTION_CACHE_PATH", Path(__file__).parent / "prediction_cache.sqlite"),
+        max_entries=int(os.environ.get("PREDICTION_CACHE_SIZE", 20000)),
+    )
+    return PredictionCache(backend, ttl=int(os.environ.get("PREDICTION_CACHE_TTL", 900)))
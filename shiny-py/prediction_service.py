@@ -0,0 +1,438 @@
+"""Feature building and model scoring shared by the Shiny UI and the HTTP API.
+
+Everything here is free of UI/reactive state: the Shiny handler and the
+JSON endpoints in api.py both call ``predict_flight`` for single flights and
+``predict_batch`` for lists of flights.
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from airports import get_registry
+from batch_predict import WEATHER_HORIZON_DAYS, score_frame
+from calendar_features import calendar_features, hhmm, hour_of
+from congestion import CONGESTION_FEATURES, get_store
+from metrics import inc, register_collector, request_trace, span
+from model_registry import registry_from_env
+from prediction_cache import prediction_cache_from_env
+from startup import phase
+from uncertainty import OUTPUT_COLUMNS as UNCERTAINTY_COLUMNS
+from uncertainty import tables_for
+from weather_fetch import get_weather_features_async
+
+logger = logging.getLogger(__name__)
+
+# Shared by every caller in the process. Models load on first use (or in
+# warm_up); the airport table is read through get_registry() when needed
+models = registry_from_env()
+prediction_cache = prediction_cache_from_env()
+
+# Where model calls run: "thread", or "process" for a pool forked from this
+# (already loaded) process, whose children share the pipelines copy-on-write
+PREDICTION_EXECUTOR = os.environ.get("PREDICTION_EXECUTOR", "thread")
+PREDICTION_POOL_SIZE = int(os.environ.get("PREDICTION_POOL_SIZE", 0)) or None
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+# Called in each pool process as it starts (serve.py closes its listening socket there)
+pool_initializer = None
+
+
+def __getattr__(name):
+    # ``prediction_service.airports`` without reading the CSVs at import
+    if name == "airports":
+        return get_registry()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@register_collector
+def _cache_metrics():
+    stats = prediction_cache.stats()
+    return [("prediction_cache_entries", {}, stats.get("size", 0)),
+            ("prediction_cache_hit_rate", {}, stats["hit_rate"])]
+
+
+MODEL_LABELS = {
+    "weather": "Weather-based Model",
+    "no_weather": "Historical Data Model",
+}
+
+# Candidates for the what-if sweep: the carriers the models were trained
+# on, departing on the hour through the day
+SWEEP_CARRIERS = ["AA", "AS", "B6", "DL", "F9", "G4", "HA", "NK", "UA", "WN"]
+SWEEP_HOURS = list(range(5, 24))
+
+RANK_COLUMNS = {
+    "arr_delay": "ARR_DELAY_PRED",
+    "dep_delay": "DEP_DELAY_PRED",
+    "cancel_prob": "CANCEL_PROB",
+}
+
+# JSON request fields -> batch schedule columns
+REQUEST_FIELDS = {
+    "origin": "ORIGIN_IATA",
+    "dest": "DEST_IATA",
+    "carrier": "MKT_AIRLINE",
+    "date": "DATE",
+    "dep_time": "SCH_DEP_TIME",
+    "arr_time": "SCH_ARR_TIME",
+}
+
+
+class InvalidInput(ValueError):
+    """Raised for user input that cannot be scored; the message is user-facing."""
+
+
+def parse_hms(timestr):
+    try:
+        return datetime.strptime(timestr, "%H:%M:%S").time()
+    except ValueError:
+        return None
+
+
+def _parse_time(value):
+    value = str(value).strip()
+    return parse_hms(f"{value}:00" if len(value) == 5 else value)
+
+
+def carrier_warning(carrier):
+    """User-facing note for a carrier the models were not trained on, else None."""
+    carrier = str(carrier).strip().upper()
+    if carrier in SWEEP_CARRIERS:
+        return None
+    return (f"Carrier {carrier} is not one the models were trained on ({', '.join(SWEEP_CARRIERS)}); "
+            "its prediction only reflects the route, date and times")
+
+
+def _flight_list(flights, fields, what):
+    """Check a JSON list of flight dicts; returns it as a schedule frame."""
+    if not isinstance(flights, list) or not flights:
+        raise InvalidInput(f"{what} must be a non-empty list of flights")
+    if not all(isinstance(f, dict) for f in flights):
+        raise InvalidInput(f"Each entry in {what} must be an object with {', '.join(fields)}")
+    missing = [f for f in fields if all(f not in flight for flight in flights)]
+    if missing:
+        raise InvalidInput(f"Entries in {what} are missing fields: {', '.join(missing)}")
+    return pd.DataFrame(flights).rename(columns=REQUEST_FIELDS)
+
+
+def _whole_number(value):
+    """``value`` as an int if it is a whole number (330, 330.0, "330"), else None."""
+    if isinstance(value, bool):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return int(number) if number.is_integer() else None
+
+
+def _sweep_grid_args(duration, carriers, dep_hours):
+    """Validated (duration, carriers, dep_hours) for sweep_schedule."""
+    duration = _whole_number(duration)
+    if duration is None:
+        raise InvalidInput("duration must be a whole number of minutes")
+    if not 0 < duration < 1440:
+        raise InvalidInput("duration must be between 1 and 1439 minutes")
+    if carriers is not None:
+        if not isinstance(carriers, list) or not carriers:
+            raise InvalidInput("carriers must be a non-empty list of airline codes")
+        carriers = [str(c).strip().upper() for c in carriers]
+        unknown = [c for c in carriers if c not in SWEEP_CARRIERS]
+        if unknown:
+            raise InvalidInput(f"Unknown carriers: {', '.join(unknown)}. "
+                               f"Choose from {', '.join(SWEEP_CARRIERS)}")
+    if dep_hours is not None:
+        if not isinstance(dep_hours, list) or not dep_hours:
+            raise InvalidInput("dep_hours must be a non-empty list of hours (0-23)")
+        dep_hours = [_whole_number(h) for h in dep_hours]
+        if any(h is None or not 0 <= h <= 23 for h in dep_hours):
+            raise InvalidInput("dep_hours must be whole hours between 0 and 23")
+    return duration, carriers, dep_hours
+
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(str(value), "%Y-%m-%d").date()
+    except ValueError:
+        raise InvalidInput("Invalid date. Please use YYYY-MM-DD format.")
+
+
+def build_input(origin, dest, flight_date, carrier, dep_time, arr_time):
+    """Validate one flight and return its model input row as a dict."""
+    dep_time_obj = _parse_time(dep_time)
+    arr_time_obj = _parse_time(arr_time)
+    if not dep_time_obj or not arr_time_obj:
+        raise InvalidInput("Invalid time format. Please use HH:MM format (e.g., 08:00)")
+
+    origin = str(origin).strip().upper()
+    dest = str(dest).strip().upper()
+    with span("airport_lookup"):
+        airports = get_registry()
+        if origin not in airports or dest not in airports:
+            raise InvalidInput("Invalid airport code. Please check your airport codes.")
+        origin_type, origin_elev = airports.airport_type(origin), airports.elevation(origin)
+        dest_type, dest_elev = airports.airport_type(dest), airports.elevation(dest)
+
+    flight_date = _parse_date(flight_date)
+    calendar = calendar_features(flight_date)
+    dep_time_min = dep_time_obj.hour * 60 + dep_time_obj.minute
+    arr_time_min = arr_time_obj.hour * 60 + arr_time_obj.minute
+    sch_duration = arr_time_min - dep_time_min
+    if sch_duration < 0:
+        sch_duration += 1440
+    # Clock times in hhmm, as in the BTS training data
+    sch_dep_time = hhmm(dep_time_obj.hour, dep_time_obj.minute)
+    sch_arr_time = hhmm(arr_time_obj.hour, arr_time_obj.minute)
+
+    return {
+        "DATE": flight_date,
+        "WEEK": calendar["WEEK"],
+        "MKT_AIRLINE": str(carrier).strip().upper(),
+        "ORIGIN_IATA": origin,
+        "DEST_IATA": dest,
+        "SCH_DEP_TIME": sch_dep_time,
+        "SCH_ARR_TIME": sch_arr_time,
+        "SCH_DURATION": sch_duration,
+        "DISTANCE": 0,
+        "ORIGIN_TYPE": origin_type,
+        "ORIGIN_ELEV": origin_elev,
+        "DEST_TYPE": dest_type,
+        "DEST_ELEV": dest_elev,
+        "IS_WEEKEND": calendar["IS_WEEKEND"],
+        "IS_HOLIDAY": calendar["IS_HOLIDAY"],
+        "DEP_HOUR": hour_of(sch_dep_time),
+        "ARR_HOUR": hour_of(sch_arr_time),
+    }
+
+
+async def predict_flight(origin, dest, flight_date, carrier, dep_time, arr_time, today=None):
+    """Score one flight; weather models within a week, historical otherwise.
+
+    Returns a dict with model_set, model_label, cancel_prob, dep_delay and
+    arr_delay. When the models have uncertainty tables it also has
+    dep_delay_interval and arr_delay_interval ([low, high] minutes, covering
+    interval_coverage of held-out outcomes) and cancel_prob_calibrated, each
+    None where calibration had no data. ``congestion`` (current
+    airport/carrier conditions, or None) is added when a congestion feed is
+    configured. Raises InvalidInput for bad airport codes, dates or times.
+    """
+    with request_trace("predict_flight"):
+        with span("parse_input"):
+            input_data = build_input(origin, dest, flight_date, carrier, dep_time, arr_time)
+        flight_date = input_data["DATE"]
+        days_difference = (flight_date - (today or datetime.now().date())).days
+
+        model_set = "no_weather"
+        if days_difference <= WEATHER_HORIZON_DAYS:
+            airports = get_registry()
+            lat_o, lon_o = airports.coords(input_data["ORIGIN_IATA"])
+            lat_d, lon_d = airports.coords(input_data["DEST_IATA"])
+            with span("weather_fetch"):
+                weather_info = await get_weather_features_async(
+                    lat_o, lon_o, lat_d, lon_d, flight_date.strftime("%Y-%m-%d")
+                )
+            if weather_info is not None:
+                input_data.update(weather_info)
+                model_set = "weather"
+
+        # Model input: NaN where there is no congestion figure
+        input_data.update(dict.fromkeys(CONGESTION_FEATURES, np.nan))
+        store = get_store()
+        congestion = None
+        if store is not None:
+            sch_dep = input_data["SCH_DEP_TIME"]
+            departure = datetime.combine(flight_date, datetime.min.time()) + timedelta(
+                hours=hour_of(sch_dep), minutes=sch_dep % 100)
+            if store.near(departure):
+                with span("congestion"):
+                    congestion = store.features(
+                        input_data["ORIGIN_IATA"], input_data["DEST_IATA"], input_data["MKT_AIRLINE"])
+                input_data.update({k: np.nan if v is None else v for k, v in congestion.items()})
+
+        with span("predict"):
+            predicted = await run_in_pool(_predict_row, model_set, input_data)
+        inc("predictions_total", model_set=model_set, path="single")
+    result = {
+        "model_set": model_set,
+        "model_label": MODEL_LABELS[model_set],
+        **predicted,
+    }
+    tables = tables_for(models)
+    if tables is not None:
+        result.update(tables.apply_row(model_set, input_data, predicted))
+    if store is not None:
+        result["congestion"] = congestion
+    return result
+
+
+def _predict_row(model_set, row):
+    return prediction_cache.predict(models, model_set, row)
+
+
+def warm_up():
+    """Load models and lookup tables now instead of on the first request.
+
+    Called through startup.start() in the eager and background startup
+    modes; serve.py uses it before forking so all workers share one copy.
+    """
+    from route_stats import get_route_stats
+
+    with phase("airports"):
+        get_registry()
+    with phase("models"):
+        models.warm_up()
+    with phase("fused_predictors"):
+        for model_set in models.files:
+            models.fused(model_set)
+    with phase("calendar"):
+        calendar_features(date.today())
+    with phase("route_stats"):
+        get_route_stats()
+    with phase("uncertainty"):
+        tables_for(models)
+
+
+def prediction_pool():
+    """Executor for model calls, created on first use in each process."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            if PREDICTION_EXECUTOR == "process":
+                _pool = ProcessPoolExecutor(PREDICTION_POOL_SIZE, mp_context=multiprocessing.get_context("fork"),
+                                            initializer=_init_pool_process)
+            else:
+                _pool = ThreadPoolExecutor(PREDICTION_POOL_SIZE, thread_name_prefix="predict")
+            _pool_pid = os.getpid()
+    return _pool
+
+
+def _init_pool_process():
+    # Forked from a running server: drop its signal handlers; the worker
+    # shuts the pool down itself
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if pool_initializer is not None:
+        pool_initializer()
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+async def run_in_pool(fn, *args, **kwargs):
+    """Run ``fn`` on the prediction pool so the event loop stays responsive.
+
+    Threads keep the caller's metrics context; with the process pool the
+    spans and counters recorded inside ``fn`` stay in the pool process.
+    """
+    call = functools.partial(fn, *args, **kwargs)
+    if PREDICTION_EXECUTOR != "process":
+        call = functools.partial(contextvars.copy_context().run, call)
+    return await asyncio.get_running_loop().run_in_executor(prediction_pool(), call)
+
+
+def predict_batch(flights, today=None):
+    """Score a list of request dicts (see REQUEST_FIELDS) or a schedule frame.
+
+    Returns the batch scorer's frame, one row per input flight, with
+    MODEL_SET, CANCEL_PROB, DEP_DELAY_PRED, ARR_DELAY_PRED and ERROR, plus
+    UNCERTAINTY_COLUMNS when the models have uncertainty tables.
+    """
+    with request_trace("predict_batch"):
+        if not isinstance(flights, pd.DataFrame):
+            flights = _flight_list(list(flights), list(REQUEST_FIELDS), "flights")
+        return score_frame(flights, models, get_registry(), today=today, congestion=get_store())
+
+
+async def predict_batch_async(flights, today=None):
+    # Batch scoring is CPU-bound; keep it off the event loop
+    return await run_in_pool(predict_batch, flights, today)
+
+
+def sweep_schedule(origin, dest, flight_date, duration, carriers=None, dep_hours=None):
+    """Schedule frame with one flight per carrier x departure hour."""
+    carriers = [str(c).strip().upper() for c in (carriers or SWEEP_CARRIERS)]
+    dep_hours = [int(h) for h in (dep_hours if dep_hours is not None else SWEEP_HOURS)]
+    dep_min = np.array([h * 60 for h in dep_hours])
+    arr_min = (dep_min + int(duration)) % 1440
+    grid = pd.DataFrame({
+        "MKT_AIRLINE": np.repeat(carriers, len(dep_hours)),
+        "SCH_DEP_TIME": np.tile([f"{m // 60:02d}:{m % 60:02d}" for m in dep_min], len(carriers)),
+        "SCH_ARR_TIME": np.tile([f"{m // 60:02d}:{m % 60:02d}" for m in arr_min], len(carriers)),
+    })
+    grid["ORIGIN_IATA"] = origin
+    grid["DEST_IATA"] = dest
+    grid["DATE"] = str(flight_date)
+    return grid
+
+
+def predict_sweep(origin, dest, flight_date, duration=None, carriers=None, dep_hours=None, schedule=None,
+                  rank_by="arr_delay", today=None):
+    """Score every candidate flight on a route/date and rank them.
+
+    Candidates are ``schedule`` (dicts with carrier, dep_time, arr_time)
+    when given, otherwise every carrier x departure hour with a flight
+    time of ``duration`` minutes; grid carriers must be SWEEP_CARRIERS.
+    All candidates go through the batch scorer together, so weather is
+    looked up once per endpoint and each model set runs once.
+
+    Returns a frame sorted best first. Candidates that could not be scored
+    follow with RANK 0 and their ERROR; if none could be scored,
+    InvalidInput names them.
+    """
+    origin = str(origin).strip().upper()
+    dest = str(dest).strip().upper()
+    airports = get_registry()
+    if origin not in airports or dest not in airports:
+        raise InvalidInput("Invalid airport code. Please check your airport codes.")
+    flight_date = _parse_date(flight_date)
+    if rank_by not in RANK_COLUMNS:
+        raise InvalidInput(f"rank_by must be one of {', '.join(RANK_COLUMNS)}")
+
+    if schedule is not None:
+        flights = _flight_list(schedule, ["carrier", "dep_time", "arr_time"], "schedule")
+        flights["ORIGIN_IATA"] = origin
+        flights["DEST_IATA"] = dest
+        flights["DATE"] = str(flight_date)
+    else:
+        if duration is None:
+            raise InvalidInput("A flight duration (minutes) is needed to build the departure grid")
+        duration, carriers, dep_hours = _sweep_grid_args(duration, carriers, dep_hours)
+        flights = sweep_schedule(origin, dest, flight_date, duration, carriers, dep_hours)
+
+    with request_trace("predict_sweep"):
+        scored = score_frame(flights, models, airports, today=today, congestion=get_store())
+    valid = scored["ERROR"] == ""
+    if not valid.any():
+        failed = [f"{row.MKT_AIRLINE} {row.SCH_DEP_TIME}: {row.ERROR}" for row in scored.itertuples()]
+        more = f" (and {len(failed) - 5} more)" if len(failed) > 5 else ""
+        raise InvalidInput("No candidate flight could be scored: " + "; ".join(failed[:5]) + more)
+    ranked = scored[valid].sort_values([RANK_COLUMNS[rank_by], "CANCEL_PROB"], kind="stable")
+    ranked.insert(0, "RANK", np.arange(1, len(ranked) + 1))
+    rejected = scored[~valid].assign(RANK=0)
+    ranked = pd.concat([ranked, rejected]).reset_index(drop=True)
+    columns = ["RANK", "MKT_AIRLINE", "SCH_DEP_TIME", "SCH_ARR_TIME", "MODEL_SET",
+               "CANCEL_PROB", "DEP_DELAY_PRED", "ARR_DELAY_PRED", "ERROR"]
+    return ranked[columns + [c for c in UNCERTAINTY_COLUMNS if c in ranked]]
+
+
+async def predict_sweep_async(*args, **kwargs):
+    return await run_in_pool(predict_sweep, *args, **kwargs)
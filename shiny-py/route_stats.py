@@ -0,0 +1,250 @@
+"""Precomputed historical baselines by route, carrier, weekday and departure hour.
+
+``python route_stats.py combined.csv data/route_stats.npz`` builds the cube
+offline from training data (CSV, Parquet file or an ingested dataset
+directory). Each cell keyed on (ORIGIN_IATA, DEST_IATA, MKT_AIRLINE, WEEK,
+DEP_HOUR) keeps a flight count, cancellations, delay sums and a small
+histogram of DEP_DELAY/ARR_DELAY. All of these add up, so any roll-up
+(leave a key out) is a sum over cells, and quantiles and on-time rates
+come from the summed histograms.
+"""
+import argparse
+import os
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+DATA_DIR = Path(__file__).parent / "data"
+
+KEYS = ["ORIGIN_IATA", "DEST_IATA", "MKT_AIRLINE", "WEEK", "DEP_HOUR"]
+
+# Delay histogram edges in minutes; values outside are clipped into the end bins.
+# 15 is an edge so the on-time rate (< 15 min late) is exact.
+DELAY_EDGES = np.array([-60, -30, -15, -5, 0, 5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 240, 360])
+ON_TIME_BINS = int(np.searchsorted(DELAY_EDGES, 15))
+
+# Memoized query results kept per cube
+CACHE_SIZE = 10000
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+# Keys of a query() result, and the columns of breakdown() after its key
+RESULT_COLUMNS = [
+    "flights", "cancel_rate", "dep_delay_mean", "dep_delay_p50", "dep_delay_p90",
+    "arr_delay_mean", "arr_delay_p50", "arr_delay_p90", "on_time_rate",
+]
+
+
+class RouteStats:
+    """Compact cube of flight statistics with roll-up queries.
+
+    ``query(origin="JFK", carrier="AA")`` aggregates every cell matching
+    the given keys; ``breakdown("MKT_AIRLINE", origin="JFK", dest="LAX")``
+    returns one row per carrier on that route. Results are memoized, so
+    repeated lookups from the UI are dictionary hits.
+    """
+
+    def __init__(self, vocab, codes, count, cancelled, delay_n, delay_sum, delay_hist):
+        self.vocab = vocab  # key -> array of values; codes index into it
+        self.codes = codes  # key -> int array, one entry per cell
+        self.count = count
+        self.cancelled = cancelled
+        self.delay_n = delay_n  # "dep"/"arr" -> flights with a recorded delay
+        self.delay_sum = delay_sum
+        self.delay_hist = delay_hist  # "dep"/"arr" -> (cells, bins)
+        self._lookup = {key: {v: i for i, v in enumerate(values)} for key, values in vocab.items()}
+        # Row numbers of the cells holding each value, per key
+        self._rows = {}
+        for key, codes_ in codes.items():
+            order = np.argsort(codes_, kind="stable")
+            bounds = np.searchsorted(codes_[order], np.arange(len(vocab[key]) + 1))
+            self._rows[key] = [order[bounds[i]:bounds[i + 1]] for i in range(len(vocab[key]))]
+        self._cache = {}
+
+    @classmethod
+    def build(cls, flights):
+        """Aggregate a frame of historical flights into the cube."""
+        flights = flights.copy()
+        if "DEP_HOUR" not in flights:
+            flights["DEP_HOUR"] = pd.to_numeric(flights["SCH_DEP_TIME"], errors="coerce") // 100
+        flights = flights.dropna(subset=KEYS)
+        flights["DEP_HOUR"] = flights["DEP_HOUR"].astype(int)
+
+        vocab, codes = {}, {}
+        for key in KEYS:
+            cat = pd.Categorical(flights[key].astype(str) if key != "DEP_HOUR" else flights[key])
+            vocab[key] = np.asarray(cat.categories, dtype=int if key == "DEP_HOUR" else str)
+            codes[key] = cat.codes.astype(np.int32)
+        cell = pd.MultiIndex.from_arrays([codes[k] for k in KEYS]).factorize()[0] if len(flights) else np.array([], int)
+        n_cells = int(cell.max()) + 1 if len(cell) else 0
+
+        first = np.full(n_cells, -1)
+        first[cell[::-1]] = np.arange(len(cell))[::-1]
+        cell_codes = {key: codes[key][first].astype(np.int32) for key in KEYS}
+        count = np.bincount(cell, minlength=n_cells)
+        cancelled = np.bincount(cell, weights=flights["CANCELLED"].fillna(0).to_numpy(), minlength=n_cells)
+
+        delay_n, delay_sum, delay_hist = {}, {}, {}
+        for side, col in (("dep", "DEP_DELAY"), ("arr", "ARR_DELAY")):
+            values = pd.to_numeric(flights[col], errors="coerce").to_numpy(dtype=float)
+            known = ~np.isnan(values)
+            delay_n[side] = np.bincount(cell[known], minlength=n_cells)
+            delay_sum[side] = np.bincount(cell[known], weights=values[known], minlength=n_cells)
+            bins = np.clip(np.searchsorted(DELAY_EDGES, values[known], side="right") - 1, 0, len(DELAY_EDGES) - 2)
+            n_bins = len(DELAY_EDGES) - 1
+            delay_hist[side] = np.bincount(cell[known] * n_bins + bins, minlength=n_cells * n_bins).reshape(n_cells, n_bins)
+
+        dtype = np.uint16 if count.max(initial=0) < 2 ** 16 else np.uint32
+        return cls(
+            vocab, cell_codes, count.astype(dtype), cancelled.astype(dtype),
+            {k: v.astype(dtype) for k, v in delay_n.items()},
+            {k: v.astype(np.float32) for k, v in delay_sum.items()},
+            {k: v.astype(dtype) for k, v in delay_hist.items()},
+        )
+
+    def save(self, path):
+        arrays = {"count": self.count, "cancelled": self.cancelled}
+        for key in KEYS:
+            arrays[f"vocab_{key}"] = self.vocab[key]
+            arrays[f"codes_{key}"] = self.codes[key]
+        for side in ("dep", "arr"):
+            arrays[f"{side}_n"] = self.delay_n[side]
+            arrays[f"{side}_sum"] = self.delay_sum[side]
+            arrays[f"{side}_hist"] = self.delay_hist[side]
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as f:
+            return cls(
+                vocab={key: f[f"vocab_{key}"] for key in KEYS},
+                codes={key: f[f"codes_{key}"] for key in KEYS},
+                count=f["count"],
+                cancelled=f["cancelled"],
+                delay_n={side: f[f"{side}_n"] for side in ("dep", "arr")},
+                delay_sum={side: f[f"{side}_sum"] for side in ("dep", "arr")},
+                delay_hist={side: f[f"{side}_hist"] for side in ("dep", "arr")},
+            )
+
+    def __len__(self):
+        return len(self.count)
+
+    def _select(self, filters):
+        """Cell rows matching every given key (empty if a value is unknown)."""
+        matches = []
+        for key, value in filters.items():
+            i = self._lookup[key].get(_coerce(key, value))
+            if i is None:
+                return np.array([], dtype=np.int64)
+            matches.append((key, i))
+        if not matches:
+            return np.arange(len(self.count))
+        # Start from the most selective key and narrow down with the others
+        matches.sort(key=lambda m: len(self._rows[m[0]][m[1]]))
+        key, i = matches[0]
+        rows = self._rows[key][i]
+        for key, i in matches[1:]:
+            rows = rows[self.codes[key][rows] == i]
+        return rows
+
+    def query(self, origin=None, dest=None, carrier=None, week=None, hour=None):
+        """Aggregated baseline for the given keys; omitted keys are rolled up.
+
+        Returns a dict with flights, cancel_rate, dep/arr delay means,
+        medians and 90th percentiles, and the on-time rate (arrival less
+        than 15 minutes late). Rates are None when no flights match.
+        """
+        filters = {k: v for k, v in zip(KEYS, (origin, dest, carrier, week, hour)) if v is not None}
+        cache_key = tuple(sorted(filters.items()))
+        result = self._cache.get(cache_key)
+        if result is None:
+            result = self._aggregate(self._select(filters))
+            if len(self._cache) >= CACHE_SIZE:
+                self._cache.clear()
+            self._cache[cache_key] = result
+        return result
+
+    def _aggregate(self, rows):
+        flights = int(self.count[rows].sum(dtype=np.int64))
+        result = {
+            "flights": flights,
+            "cancel_rate": float(self.cancelled[rows].sum(dtype=np.int64)) / flights if flights else None,
+        }
+        for side in ("dep", "arr"):
+            n = int(self.delay_n[side][rows].sum(dtype=np.int64))
+            hist = self.delay_hist[side][rows].sum(axis=0, dtype=np.int64)
+            result[f"{side}_delay_mean"] = float(self.delay_sum[side][rows].sum(dtype=np.float64)) / n if n else None
+            result[f"{side}_delay_p50"] = _quantile(hist, 0.5)
+            result[f"{side}_delay_p90"] = _quantile(hist, 0.9)
+        arr_hist = self.delay_hist["arr"][rows].sum(axis=0, dtype=np.int64)
+        result["on_time_rate"] = float(arr_hist[:ON_TIME_BINS].sum() / arr_hist.sum()) if arr_hist.sum() else None
+        return result
+
+    def breakdown(self, by, min_flights=30, **filters):
+        """One aggregated row per value of key ``by`` (e.g. "MKT_AIRLINE").
+
+        ``filters`` take the ``query`` argument names. Values with fewer
+        than ``min_flights`` flights are left out, so the frame may be
+        empty (it always has the ``by`` and RESULT_COLUMNS columns).
+        """
+        args = dict(filters)
+        name = dict(zip(KEYS, ("origin", "dest", "carrier", "week", "hour")))[by]
+        rows = []
+        for value in self.vocab[by]:
+            args[name] = value.item() if hasattr(value, "item") else value
+            result = self.query(**args)
+            if result["flights"] >= min_flights:
+                rows.append({by: args[name], **result})
+        frame = pd.DataFrame(rows, columns=[by] + RESULT_COLUMNS)
+        if by == "WEEK" and len(frame):
+            frame = frame.set_index("WEEK").reindex([d for d in WEEKDAYS if d in set(frame["WEEK"])]).reset_index()
+        return frame
+
+
+def _coerce(key, value):
+    if key == "DEP_HOUR":
+        return int(value)
+    return str(value).strip().upper() if key != "WEEK" else str(value).strip().title()[:3]
+
+
+def _quantile(hist, q):
+    """Quantile of a delay histogram, interpolated linearly within its bin."""
+    total = hist.sum()
+    if not total:
+        return None
+    target = q * total
+    cum = np.cumsum(hist)
+    i = int(np.searchsorted(cum, target))
+    before = cum[i - 1] if i else 0
+    frac = (target - before) / hist[i] if hist[i] else 0.0
+    return float(DELAY_EDGES[i] + frac * (DELAY_EDGES[i + 1] - DELAY_EDGES[i]))
+
+
+@lru_cache(maxsize=1)
+def get_route_stats():
+    """Shared cube from ROUTE_STATS_PATH (default data/route_stats.npz), or None."""
+    path = Path(os.environ.get("ROUTE_STATS_PATH", DATA_DIR / "route_stats.npz"))
+    return RouteStats.load(path) if path.exists() else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the route/carrier/weekday/hour statistics cube.")
+    parser.add_argument("flights", help="training CSV, Parquet file or ingested dataset directory")
+    parser.add_argument("output", nargs="?", default=str(DATA_DIR / "route_stats.npz"))
+    args = parser.parse_args(argv)
+
+    columns = ["ORIGIN_IATA", "DEST_IATA", "MKT_AIRLINE", "WEEK", "SCH_DEP_TIME", "CANCELLED", "DEP_DELAY", "ARR_DELAY"]
+    path = Path(args.flights)
+    if path.is_dir() or path.suffix == ".parquet":
+        flights = pd.read_parquet(path, columns=columns)
+    else:
+        flights = pd.read_csv(path, usecols=columns)
+    stats = RouteStats.build(flights)
+    stats.save(args.output)
+    print(f"Wrote {len(stats)} cells from {len(flights)} flights to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""Pre-forking multi-worker server for the Shiny app and the JSON API.
+
+``shiny.run_app`` serves everything from one process. Here the parent
+loads the models, airport table, calendar and route statistics once, binds
+the port, and then forks the workers. Each worker runs uvicorn on the
+shared socket, and everything loaded before the fork is shared
+copy-on-write instead of being loaded again per worker. Dead workers are
+replaced, and SIGTERM/SIGINT stop them all. Congestion feeds
+(CONGESTION_FEED / CONGESTION_LISTEN) also run in the parent, which
+forwards each event to every worker.
+
+    python serve.py --workers 4 --app both --port 8000
+
+Every option also reads an environment variable (SERVE_HOST, SERVE_PORT,
+SERVE_WORKERS, SERVE_APP, SERVE_THREADS_PER_WORKER, PREDICTION_EXECUTOR,
+PREDICTION_POOL_SIZE), so deployments can be configured without flags.
+Workers share their metrics through METRICS_DIR (a temporary directory
+by default), so /metrics on any worker reports all of them.
+Shiny sessions live on the worker that holds their websocket. Behind a
+load balancer spanning several machines, use sticky sessions.
+"""
+import argparse
+import gc
+import logging
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# A worker exiting sooner than this after starting is respawned with a delay
+MIN_WORKER_LIFETIME = 5.0
+
+
+def load_app(kind):
+    if kind == "ui":
+        from app import app
+        return app
+    if kind == "api":
+        from api import app
+        return app
+    from api import make_combined
+    return make_combined()
+
+
+def bind(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _exit_worker(signum, frame):
+    sys.exit(0)
+
+
+def run_worker(app, sock, log_level):
+    import uvicorn
+
+    import prediction_service
+
+    # Replace the supervisor's handlers. uvicorn re-raises the signal it
+    # stopped on once it is done, which lands here and unwinds to the cleanup
+    signal.signal(signal.SIGTERM, _exit_worker)
+    signal.signal(signal.SIGINT, _exit_worker)
+    # Pool processes must not keep the port open after their worker is gone
+    prediction_service.pool_initializer = sock.close
+    server = uvicorn.Server(uvicorn.Config(app, log_level=log_level, timeout_graceful_shutdown=10))
+    try:
+        server.run(sockets=[sock])
+    finally:
+        # Workers leave through os._exit, which skips the pool's atexit cleanup
+        prediction_service.shutdown_pool()
+
+
+def serve(app, sock, workers, log_level="info", fork=os.fork):
+    """Fork ``workers`` children serving ``app`` on ``sock`` and supervise them.
+
+    ``fork`` replaces os.fork, e.g. with WorkerFanout.fork to hand the
+    workers the parent's congestion feed.
+    """
+    # Objects loaded so far never need collecting; keeping the collector off
+    # them stops it from touching (and so copying) their pages in every worker
+    gc.freeze()
+    children = {}
+    stopping = False
+
+    def spawn():
+        pid = fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(app, sock, log_level)
+            except Exception as e:
+                logger.error(f"Worker {os.getpid()} failed: {str(e)}")
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = time.monotonic()
+        logger.info(f"Started worker {pid}")
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        spawn()
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid, None)
+        if started is None or stopping:
+            continue
+        logger.warning(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, restarting")
+        if time.monotonic() - started < MIN_WORKER_LIFETIME:
+            time.sleep(1)
+        spawn()
+    sock.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the app and API from several pre-forked workers.")
+    parser.add_argument("--host", default=os.environ.get("SERVE_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("SERVE_PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("SERVE_WORKERS", os.cpu_count() or 1)))
+    parser.add_argument("--app", choices=["ui", "api", "both"], default=os.environ.get("SERVE_APP", "both"),
+                        help="Shiny app, JSON API, or both (API under /api)")
+    parser.add_argument("--threads-per-worker", type=int,
+                        default=int(os.environ.get("SERVE_THREADS_PER_WORKER", 1)),
+                        help="XGBoost/OpenMP threads in each worker")
+    parser.add_argument("--executor", choices=["thread", "process"],
+                        default=os.environ.get("PREDICTION_EXECUTOR", "thread"),
+                        help="where each worker runs model calls")
+    parser.add_argument("--pool-size", type=int, default=int(os.environ.get("PREDICTION_POOL_SIZE", 0)))
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+
+    # Read at import time by prediction_service and the OpenMP runtime, so
+    # they must be in place before the app is imported
+    os.environ["OMP_NUM_THREADS"] = str(args.threads_per_worker)
+    os.environ["PREDICTION_EXECUTOR"] = args.executor
+    os.environ["PREDICTION_POOL_SIZE"] = str(args.pool_size)
+    # Load everything before forking so the workers share it
+    os.environ["APP_STARTUP"] = "eager"
+    # Every process writes its metrics here and /metrics on any worker sums
+    # them (see metrics.py); files from an earlier run are removed
+    temporary = not os.environ.get("METRICS_DIR")
+    metrics_dir = Path(os.environ.get("METRICS_DIR") or tempfile.mkdtemp(prefix="flight-metrics-"))
+    metrics_dir.mkdir(parents=True, exist_ok=True)
+    for stale in metrics_dir.glob("*.json"):
+        stale.unlink()
+    os.environ["METRICS_DIR"] = str(metrics_dir)
+    logging.basicConfig(level=args.log_level.upper())
+    import startup
+
+    start = time.perf_counter()
+    app = load_app(args.app)
+    startup.start()
+    logger.info(f"Loaded app and models in {time.perf_counter() - start:.1f}s")
+    # Congestion feeds run here once (CONGESTION_LISTEN binds its port once)
+    # and every event is forwarded to the workers
+    from congestion import share_feeds
+    fanout = share_feeds()
+
+    sock = bind(args.host, args.port)
+    logger.info(f"Serving {args.app} on http://{args.host}:{args.port} with {args.workers} workers")
+    serve(app, sock, args.workers, args.log_level, fork=fanout.fork if fanout else os.fork)
+    if temporary:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+"""Startup modes, readiness, and a report of what a cold start costs.
+
+APP_STARTUP selects when the models and lookup tables load:
+
+* ``lazy`` (default): on first use. The app is ready as soon as it is imported.
+* ``background``: a thread warms everything while the server is already
+  accepting connections. ``/ready`` answers 503 until it is done.
+* ``eager``: before the server starts. serve.py uses this so its workers
+  share what the parent loaded.
+
+Each phase's wall time and the number of modules it imported are recorded
+and logged once warm-up finishes. ``python startup.py`` runs a cold start
+under ``-X importtime`` and prints the phases with the packages that cost
+the most in each.
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+MODE = os.environ.get("APP_STARTUP", "lazy")
+
+# Written to stderr at the start of each phase when profiling, so the
+# -X importtime lines that follow can be attributed to it
+MARKER = "startup-phase:"
+
+_t0 = time.perf_counter()
+_modules0 = len(sys.modules)
+_phases = []
+_ready = threading.Event()
+_started = False
+_lock = threading.Lock()
+
+
+@contextmanager
+def phase(name):
+    """Time one startup phase and count the modules it imports."""
+    if os.environ.get("STARTUP_MARKERS"):
+        print(f"{MARKER} {name}", file=sys.stderr, flush=True)
+    start = time.perf_counter()
+    modules = len(sys.modules)
+    try:
+        yield
+    finally:
+        _phases.append({
+            "phase": name,
+            "seconds": round(time.perf_counter() - start, 4),
+            "modules": len(sys.modules) - modules,
+        })
+
+
+def start(mode=None):
+    """Begin warm-up according to ``mode`` (default APP_STARTUP). Runs once."""
+    global _started
+    with _lock:
+        if _started:
+            return
+        _started = True
+    # Everything imported since this module was: the app and its dependencies
+    _phases.insert(0, {
+        "phase": "import",
+        "seconds": round(time.perf_counter() - _t0, 4),
+        "modules": len(sys.modules) - _modules0,
+    })
+    mode = mode or MODE
+    if mode == "eager":
+        warm()
+    elif mode == "background":
+        threading.Thread(target=warm, name="warm-up", daemon=True).start()
+    else:
+        _ready.set()
+
+
+def warm():
+    from prediction_service import warm_up
+
+    try:
+        warm_up()
+    except Exception as e:
+        # Requests will retry the loads themselves
+        logger.error(f"Warm-up failed: {str(e)}")
+    _ready.set()
+    logger.info("Startup: " + ", ".join(f"{p['phase']} {p['seconds']:.2f}s" for p in _phases))
+
+
+def is_ready():
+    return _ready.is_set()
+
+
+def report():
+    return {"mode": MODE, "ready": is_ready(), "phases": list(_phases)}
+
+
+def _parse_importtime(stderr):
+    """Self import time (seconds) per phase and top-level package."""
+    current = "import"
+    costs = {current: {}}
+    for line in stderr.splitlines():
+        if line.startswith(MARKER):
+            current = line[len(MARKER):].strip()
+            costs.setdefault(current, {})
+        elif line.startswith("import time:") and "|" in line:
+            self_us, _, name = line[len("import time:"):].split("|")
+            if not self_us.strip().isdigit():
+                continue  # the header line
+            package = name.strip().split(".")[0]
+            costs[current][package] = costs[current].get(package, 0) + int(self_us) / 1e6
+    return costs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Profile a cold start of the app, phase by phase.")
+    parser.add_argument("--app", choices=["ui", "api", "both"], default="both")
+    parser.add_argument("--top", type=int, default=5, help="packages listed per phase")
+    args = parser.parse_args(argv)
+
+    code = (
+        "import startup, json, serve\n"
+        f"serve.load_app({args.app!r})\n"
+        "startup.start('eager')\n"
+        "print(json.dumps(startup.report()))\n"
+    )
+    env = dict(os.environ, STARTUP_MARKERS="1", APP_STARTUP="eager")
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True,
+                          cwd=Path(__file__).parent, env=env)
+    total = time.perf_counter() - start
+    if proc.returncode:
+        print(proc.stderr[-2000:], file=sys.stderr)
+        return proc.returncode
+    phases = json.loads(proc.stdout.strip().splitlines()[-1])["phases"]
+    costs = _parse_importtime(proc.stderr)
+
+    print(f"Cold start of {args.app!r}: {total:.2f}s including interpreter start (timings inflated by -X importtime)\n")
+    print(f"{'phase':<18}{'seconds':>9}{'modules':>9}  heaviest imports")
+    for p in phases:
+        top = sorted(costs.get(p["phase"], {}).items(), key=lambda kv: -kv[1])[:args.top]
+        print(f"{p['phase']:<18}{p['seconds']:>9.2f}{p['modules']:>9}  "
+              + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in top))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
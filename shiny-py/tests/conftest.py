@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The app modules are imported flat, as when running from shiny-py/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
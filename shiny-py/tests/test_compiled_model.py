@@ -0,0 +1,30 @@
+"""Compiled pipelines must score exactly like the sklearn pipelines they replace."""
+from pathlib import Path
+
+import pytest
+
+from compiled_model import CompiledPipeline, check_parity, compile_pipeline, sample_inputs
+from model_registry import MODEL_DIR, MODEL_FILES, ModelRegistry
+
+PIPELINES = [(model_set, name) for model_set, files in MODEL_FILES.items() for name in files]
+
+
+@pytest.fixture(scope="module")
+def registry():
+    if not Path(MODEL_DIR).is_dir():
+        pytest.skip(f"no models in {MODEL_DIR}")
+    return ModelRegistry(MODEL_DIR)
+
+
+@pytest.mark.parametrize("model_set,name", PIPELINES)
+def test_parity(registry, model_set, name):
+    pipeline = registry.get(model_set, name)
+    assert check_parity(pipeline, compile_pipeline(pipeline), sample_inputs(pipeline)) == 0
+
+
+@pytest.mark.parametrize("model_set,name", PIPELINES)
+def test_parity_after_reload(registry, model_set, name, tmp_path):
+    pipeline = registry.get(model_set, name)
+    compile_pipeline(pipeline).save(tmp_path / name)
+    compiled = CompiledPipeline.load(tmp_path / name)
+    assert check_parity(pipeline, compiled, sample_inputs(pipeline, seed=1)) == 0
@@ -0,0 +1,37 @@
+"""preprocess.py's UTC conversion must match lubridate on the awkward cases."""
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "code"))
+
+from preprocess import _hhmm_to_offset, local_to_utc  # noqa: E402
+
+
+def test_local_to_utc():
+    local = pd.Series(pd.to_datetime([
+        "2024-11-03 01:30",  # repeated at the fall-back: takes the DST offset
+        "2024-03-10 02:30",  # skipped at the spring-forward: rolls to 03:00 EDT
+        "2024-06-01 23:15",
+        "2024-06-01 12:00",
+        "2024-06-01 12:00",
+    ]))
+    tz = pd.Series(["America/New_York", "America/New_York", "America/Los_Angeles", None, "Nowhere/Unknown"])
+    expected = pd.Series(pd.to_datetime([
+        "2024-11-03 05:30", "2024-03-10 07:00", "2024-06-02 06:15", None, None,
+    ]))
+    pd.testing.assert_series_equal(local_to_utc(local, tz), expected)
+
+
+def test_hhmm_to_offset():
+    offsets = _hhmm_to_offset(pd.Series([530, 0, 2359, 2400, None]))
+    expected = pd.to_timedelta(pd.Series([5 * 60 + 30, 0, 23 * 60 + 59, 24 * 60, None]), unit="min")
+    pd.testing.assert_series_equal(offsets, expected)
+
+
+def test_2400_is_next_midnight():
+    day = pd.Series(pd.to_datetime(["2024-06-01"]))
+    local = day + _hhmm_to_offset(pd.Series([2400]))
+    utc = local_to_utc(local, pd.Series(["America/Chicago"]))
+    assert utc.iloc[0] == pd.Timestamp("2024-06-02 05:00")
@@ -0,0 +1,253 @@
+"""Prediction intervals and calibrated cancellation probabilities from lookup tables.
+
+``code/calibrate.py`` scores the held-out split with the deployed
+pipelines and builds ``UncertaintyTables`` from the results. Residuals
+(actual - predicted delay) are summarized as quantiles, and cancellation
+outcomes as an isotonic curve over the predicted probability. Both are
+kept per (model set, carrier, origin airport type, departure hour). Cells
+with too little data fall back to (type, hour), then (hour), then the
+whole model set. The fallback is resolved when the tables are built, so
+serving is one array index per row, for single flights and batches alike.
+
+The tables live next to the pickles as ``uncertainty.npz`` and follow the
+registry when it switches model directories.
+"""
+import logging
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+TABLES_FILE = "uncertainty.npz"
+
+MODEL_SETS = ["weather", "no_weather"]
+QUANTILES = np.array([0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95])
+HOURS = 24
+
+# Probability bins for calibration curves (values are stored at bin centers)
+CALIBRATION_BINS = 20
+
+# Fewest held-out rows a cell needs before it gets its own quantiles/curve
+MIN_RESIDUALS = 200
+MIN_CALIBRATION = 1000
+
+KEYS = ["MKT_AIRLINE", "ORIGIN_TYPE", "DEP_HOUR"]
+
+# Grouping keys, finest level first
+LEVELS = [tuple(KEYS), ("ORIGIN_TYPE", "DEP_HOUR"), ("DEP_HOUR",), ()]
+
+# Central interval reported with every forecast
+COVERAGE = 0.8
+
+OUTPUT_COLUMNS = ["DEP_DELAY_LO", "DEP_DELAY_HI", "ARR_DELAY_LO", "ARR_DELAY_HI", "CANCEL_PROB_CALIBRATED"]
+
+
+class UncertaintyTables:
+    """Dense (model set, carrier, airport type, hour) tables of residual
+    quantiles and calibration curves. The last carrier and type slots stand
+    for values not seen in calibration.
+    """
+
+    def __init__(self, carriers, types, residuals, calibration, version=""):
+        self.carriers = np.asarray(carriers, dtype=str)
+        self.types = np.asarray(types, dtype=str)
+        self.residuals = residuals  # (sets, carriers+1, types+1, hours, dep/arr, quantiles)
+        self.calibration = calibration  # (sets, carriers+1, types+1, hours, bins)
+        self.version = version
+        lo, hi = (1 - COVERAGE) / 2, 1 - (1 - COVERAGE) / 2
+        self._lo = int(np.argmin(abs(QUANTILES - lo)))
+        self._hi = int(np.argmin(abs(QUANTILES - hi)))
+
+    @classmethod
+    def build(cls, held_out, version=""):
+        """Tables from held-out predictions.
+
+        ``held_out[model_set]`` has a "delays" frame (MKT_AIRLINE,
+        ORIGIN_TYPE, DEP_HOUR, DEP_DELAY, DEP_DELAY_PRED, ARR_DELAY,
+        ARR_DELAY_PRED) and a "cancel" frame (the keys, CANCELLED,
+        CANCEL_PROB).
+        """
+        frames = [f for parts in held_out.values() for f in parts.values()]
+        carriers = sorted(set().union(*(f["MKT_AIRLINE"].dropna().astype(str) for f in frames)))
+        types = sorted(set().union(*(f["ORIGIN_TYPE"].dropna().astype(str) for f in frames)))
+        shape = (len(MODEL_SETS), len(carriers) + 1, len(types) + 1, HOURS)
+        residuals = np.full(shape + (2, len(QUANTILES)), np.nan, dtype=np.float32)
+        calibration = np.full(shape + (CALIBRATION_BINS,), np.nan, dtype=np.float32)
+
+        for s, model_set in enumerate(MODEL_SETS):
+            parts = held_out.get(model_set)
+            if parts is None:
+                continue
+            delays = _keyed(parts["delays"])
+            resid = np.column_stack([
+                delays["DEP_DELAY"] - delays["DEP_DELAY_PRED"],
+                delays["ARR_DELAY"] - delays["ARR_DELAY_PRED"],
+            ])
+            cancel = _keyed(parts["cancel"])
+            bins = _bin(cancel["CANCEL_PROB"].to_numpy())
+            hits = cancel["CANCELLED"].to_numpy(dtype=float)
+
+            res_groups = [_groups(delays, level) for level in LEVELS]
+            cal_groups = [_groups(cancel, level) for level in LEVELS]
+            for c in range(len(carriers) + 1):
+                for t in range(len(types) + 1):
+                    for h in range(HOURS):
+                        key = {"MKT_AIRLINE": carriers[c] if c < len(carriers) else None,
+                               "ORIGIN_TYPE": types[t] if t < len(types) else None, "DEP_HOUR": h}
+                        rows = _finest(res_groups, key, MIN_RESIDUALS)
+                        if rows is not None:
+                            residuals[s, c, t, h] = np.quantile(resid[rows], QUANTILES, axis=0).T
+                        rows = _finest(cal_groups, key, MIN_CALIBRATION)
+                        if rows is not None:
+                            calibration[s, c, t, h] = _curve(bins[rows], hits[rows])
+        return cls(carriers, types, residuals, calibration, version)
+
+    def save(self, path):
+        np.savez_compressed(path, carriers=self.carriers, types=self.types, residuals=self.residuals,
+                            calibration=self.calibration, version=np.array(self.version))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as f:
+            return cls(f["carriers"], f["types"], f["residuals"], f["calibration"], str(f["version"]))
+
+    def _cells(self, model_set, carriers, types, hours):
+        c = pd.Categorical(np.asarray(carriers, dtype=object), categories=self.carriers).codes
+        t = pd.Categorical(np.asarray(types, dtype=object), categories=self.types).codes
+        c = np.where(c < 0, len(self.carriers), c)
+        t = np.where(t < 0, len(self.types), t)
+        h = np.clip(np.nan_to_num(np.asarray(hours, dtype=float)), 0, HOURS - 1).astype(int)
+        return MODEL_SETS.index(model_set), c, t, h
+
+    def apply(self, model_set, features, predicted):
+        """OUTPUT_COLUMNS as arrays for a batch scored by one model set.
+
+        ``features`` holds MKT_AIRLINE, ORIGIN_TYPE and DEP_HOUR, and
+        ``predicted`` is the fused predictor's dict of arrays.
+        """
+        s, c, t, h = self._cells(model_set, features["MKT_AIRLINE"], features["ORIGIN_TYPE"],
+                                 features["DEP_HOUR"])
+        quantiles = self.residuals[s, c, t, h]  # (rows, dep/arr, quantiles)
+        dep = np.asarray(predicted["dep_delay"], dtype=float)
+        arr = np.asarray(predicted["arr_delay"], dtype=float)
+        return {
+            "DEP_DELAY_LO": dep + quantiles[:, 0, self._lo],
+            "DEP_DELAY_HI": dep + quantiles[:, 0, self._hi],
+            "ARR_DELAY_LO": arr + quantiles[:, 1, self._lo],
+            "ARR_DELAY_HI": arr + quantiles[:, 1, self._hi],
+            "CANCEL_PROB_CALIBRATED": _interpolate(self.calibration[s, c, t, h],
+                                                   np.asarray(predicted["cancel_prob"], dtype=float)),
+        }
+
+    def apply_row(self, model_set, row, predicted):
+        """The single-flight version of ``apply``: a dict of plain floats, None where unavailable."""
+        out = self.apply(model_set, {k: [row[k]] for k in ("MKT_AIRLINE", "ORIGIN_TYPE", "DEP_HOUR")},
+                         {k: [v] for k, v in predicted.items()})
+        values = {k: float(v[0]) for k, v in out.items()}
+        return {
+            "dep_delay_interval": _interval(values["DEP_DELAY_LO"], values["DEP_DELAY_HI"]),
+            "arr_delay_interval": _interval(values["ARR_DELAY_LO"], values["ARR_DELAY_HI"]),
+            "cancel_prob_calibrated": None if np.isnan(values["CANCEL_PROB_CALIBRATED"])
+            else values["CANCEL_PROB_CALIBRATED"],
+            "interval_coverage": COVERAGE,
+        }
+
+
+def _interval(lo, hi):
+    return None if np.isnan(lo) or np.isnan(hi) else [lo, hi]
+
+
+def _keyed(frame):
+    frame = frame.copy()
+    frame["MKT_AIRLINE"] = frame["MKT_AIRLINE"].astype(str)
+    frame["ORIGIN_TYPE"] = frame["ORIGIN_TYPE"].astype(str)
+    frame["DEP_HOUR"] = pd.to_numeric(frame["DEP_HOUR"], errors="coerce").fillna(0).astype(int).clip(0, HOURS - 1)
+    return frame.reset_index(drop=True)
+
+
+def _groups(frame, level):
+    """Row positions per value of ``level`` (a tuple of key columns)."""
+    if not level:
+        return {(): np.arange(len(frame))}
+    return {k if isinstance(k, tuple) else (k,): v for k, v in frame.groupby(list(level)).indices.items()}
+
+
+def _finest(groups, key, minimum):
+    """Rows of the finest level with at least ``minimum`` of them for this cell."""
+    for level, by_value in zip(LEVELS, groups):
+        if any(key[k] is None for k in level):
+            continue
+        rows = by_value.get(tuple(key[k] for k in level))
+        if rows is not None and len(rows) >= minimum:
+            return rows
+    return None
+
+
+def _bin(proba):
+    return np.clip((proba * CALIBRATION_BINS).astype(int), 0, CALIBRATION_BINS - 1)
+
+
+def _curve(bins, hits):
+    """Isotonic (non-decreasing) observed rate per probability bin."""
+    counts = np.bincount(bins, minlength=CALIBRATION_BINS).astype(float)
+    positives = np.bincount(bins, weights=hits, minlength=CALIBRATION_BINS)
+    centers = (np.arange(CALIBRATION_BINS) + 0.5) / CALIBRATION_BINS
+    seen = counts > 0
+    # Pool adjacent violators over the bins that have data
+    blocks = []  # [rate, weight, number of bins]
+    for rate, weight in zip(positives[seen] / counts[seen], counts[seen]):
+        blocks.append([rate, weight, 1])
+        while len(blocks) > 1 and blocks[-2][0] > blocks[-1][0]:
+            r2, w2, n2 = blocks.pop()
+            r1, w1, n1 = blocks.pop()
+            blocks.append([(r1 * w1 + r2 * w2) / (w1 + w2), w1 + w2, n1 + n2])
+    fitted = np.repeat([b[0] for b in blocks], [b[2] for b in blocks])
+    return np.interp(centers, centers[seen], fitted)
+
+
+def _interpolate(curves, proba):
+    """Piecewise-linear read of each row's curve at its predicted probability."""
+    pos = np.clip(proba * CALIBRATION_BINS - 0.5, 0, CALIBRATION_BINS - 1)
+    lo = np.floor(pos).astype(int)
+    hi = np.minimum(lo + 1, CALIBRATION_BINS - 1)
+    frac = pos - lo
+    rows = np.arange(len(proba))
+    return curves[rows, lo] * (1 - frac) + curves[rows, hi] * frac
+
+
+# (path, tables version, models version) combinations already warned about
+_stale_warned = set()
+
+
+@lru_cache(maxsize=4)
+def _load(path, mtime):
+    tables = UncertaintyTables.load(path)
+    logger.info(f"Loaded uncertainty tables from {path} (models {tables.version or 'unknown'})")
+    return tables
+
+
+def tables_for(registry):
+    """Tables stored with the registry's current models, or None if there are none.
+
+    Tables calibrated against another model version (the models were
+    retrained but ``calibrate.py`` was not rerun) are ignored as well.
+    """
+    path = Path(registry.model_dir) / TABLES_FILE
+    try:
+        mtime = path.stat().st_mtime_ns
+    except OSError:
+        return None
+    tables = _load(str(path), mtime)
+    if tables.version != registry.version:
+        key = (str(path), tables.version, registry.version)
+        if key not in _stale_warned:
+            _stale_warned.add(key)
+            logger.warning(
+                f"Ignoring uncertainty tables in {path}: built for models {tables.version or 'unknown'}, "
+                f"serving {registry.version}; rerun calibrate.py"
+            )
+        return None
+    return tables
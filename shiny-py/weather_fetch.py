@@ -1,62 +1,195 @@
-from datetime import datetime
-from meteostat import Point, Daily
-import time
-import pandas as pd
-
-weather_cache = {}
-
-def get_todays_forecast(lat, long, date, retries=3):
-    key = (round(lat, 2), round(long, 2), date)
-    if key in weather_cache:
-        return weather_cache[key]
-    for attempt in range(retries + 1):
-        try:
-            date_obj = datetime.strptime(date, '%Y-%m-%d')
-            location = Point(lat, long)
-            data = Daily(location, date_obj, date_obj).fetch()
-            if data.empty:
-                weather_cache[key] = None
-                return None
-            forecast = data.iloc[0]
-            '''
-            result = {
-                "temperature_avg_C": forecast['tavg'],
-                "temperature_min_C": forecast['tmin'],
-                "temperature_max_C": forecast['tmax'],
-                "precipitation_mm": forecast['prcp']
-                "wind_speed_kph": forecast['wspd'],
-                "snow_mm": forecast['snow']
-            }
-            '''
-            weather_keys = {
-                'temperature_avg_C': 'tavg',
-                'temperature_min_C': 'tmin',
-                'temperature_max_C': 'tmax',
-                'precipitation_mm': 'prcp',
-                'wind_speed_kph': 'wspd',
-                'snow_mm': 'snow'
-            }
-            result = {
-                k: 0.0 if pd.isna(forecast.get(v)) else forecast.get(v)
-                for k, v in weather_keys.items()
-            }
-            weather_cache[key] = result
-            return result
-        except Exception:
-            if attempt < retries:
-                time.sleep(1)
-            else:
-                weather_cache[key] = None
-                return None
-
-def get_weather_features_for_user_input(lat_o, lon_o, lat_d, lon_d, date_str):
-    origin = get_todays_forecast(lat_o, lon_o, date_str)
-    dest = get_todays_forecast(lat_d, lon_d, date_str)
-    if origin is None or dest is None:
-        return None
-    features = {}
-    for k, v in origin.items():
-        features[f"origin_{k}"] = v
-    for k, v in dest.items():
-        features[f"dest_{k}"] = v
-    return features
+from datetime import datetime
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+import pandas as pd
+from cache_backend import MISSING, make_cache
+from metrics import inc, register_collector
+
+# meteostat is imported by the first upstream call (see _meteostat)
+Point = Daily = None
+
+logger = logging.getLogger(__name__)
+
+# Cache lifetimes in seconds. Past days no longer change, forecasts do, and
+# failures are only remembered briefly so a Meteostat outage heals itself.
+FORECAST_TTL = int(os.environ.get("WEATHER_CACHE_FORECAST_TTL", 3 * 3600))
+HISTORICAL_TTL = int(os.environ.get("WEATHER_CACHE_HISTORICAL_TTL", 30 * 24 * 3600))
+NEGATIVE_TTL = int(os.environ.get("WEATHER_CACHE_NEGATIVE_TTL", 10 * 60))
+
+
+def _make_weather_cache():
+    backend = os.environ.get("WEATHER_CACHE_BACKEND", "sqlite")
+    path = os.environ.get("WEATHER_CACHE_PATH", Path(__file__).parent / "weather_cache.sqlite")
+    max_entries = int(os.environ.get("WEATHER_CACHE_SIZE", 50000))
+    try:
+        return make_cache(backend, path=path, max_entries=max_entries)
+    except Exception as e:
+        logger.warning(f"Falling back to in-memory weather cache: {str(e)}")
+        return make_cache("memory", max_entries=max_entries)
+
+
+weather_cache = _make_weather_cache()
+
+# Upstream calls run on a small shared pool; concurrent requests for the same
+# key wait on the one Future already in _inflight
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("WEATHER_FETCH_WORKERS", 8)),
+    thread_name_prefix="weather",
+)
+_inflight = {}
+_inflight_lock = threading.Lock()
+RETRY_BACKOFF = 0.5
+
+
+def _cache_ttl(date, result):
+    if result is None:
+        return NEGATIVE_TTL
+    if date < datetime.now().strftime('%Y-%m-%d'):
+        return HISTORICAL_TTL
+    return FORECAST_TTL
+
+
+def _remember(key, date, result):
+    weather_cache.set(key, result, ttl=_cache_ttl(date, result))
+    return result
+
+
+def _cache_key(lat, long, date):
+    return f"{round(lat, 2)},{round(long, 2)},{date}"
+
+
+def _meteostat():
+    global Point, Daily
+    if Daily is None:
+        from meteostat import Daily, Point
+    return Point, Daily
+
+
+def _fetch_with_retries(key, lat, long, date, retries):
+    # Another caller may have filled the cache while this task was queued
+    cached = weather_cache.get(key)
+    if cached is not MISSING:
+        return cached
+    for attempt in range(retries + 1):
+        inc("weather_upstream_calls_total")
+        try:
+            date_obj = datetime.strptime(date, '%Y-%m-%d')
+            point, daily = _meteostat()
+            data = daily(point(lat, long), date_obj, date_obj).fetch()
+            if data.empty:
+                inc("weather_upstream_results_total", outcome="empty")
+                return _remember(key, date, None)
+            forecast = data.iloc[0]
+            '''
+            result = {
+                "temperature_avg_C": forecast['tavg'],
+                "temperature_min_C": forecast['tmin'],
+                "temperature_max_C": forecast['tmax'],
+                "precipitation_mm": forecast['prcp']
+                "wind_speed_kph": forecast['wspd'],
+                "snow_mm": forecast['snow']
+            }
+            '''
+            weather_keys = {
+                'temperature_avg_C': 'tavg',
+                'temperature_min_C': 'tmin',
+                'temperature_max_C': 'tmax',
+                'precipitation_mm': 'prcp',
+                'wind_speed_kph': 'wspd',
+                'snow_mm': 'snow'
+            }
+            result = {
+                k: 0.0 if pd.isna(forecast.get(v)) else float(forecast.get(v))
+                for k, v in weather_keys.items()
+            }
+            inc("weather_upstream_results_total", outcome="ok")
+            return _remember(key, date, result)
+        except Exception:
+            if attempt < retries:
+                inc("weather_retries_total")
+                # Runs on a pool thread, so backing off never stalls the event loop
+                time.sleep(RETRY_BACKOFF * 2 ** attempt)
+            else:
+                inc("weather_upstream_results_total", outcome="failed")
+                return _remember(key, date, None)
+
+
+def submit_forecast(lat, long, date, retries=3):
+    """Start (or join) a weather lookup and return a concurrent Future.
+
+    Lookups for the same rounded (lat, lon, date) key that are already in
+    flight share one upstream call instead of each hitting Meteostat.
+    """
+    key = _cache_key(lat, long, date)
+    cached = weather_cache.get(key)
+    if cached is not MISSING:
+        inc("weather_cache_lookups_total", result="hit")
+        future = Future()
+        future.set_result(cached)
+        return future
+    with _inflight_lock:
+        future = _inflight.get(key)
+        if future is None:
+            future = _executor.submit(_fetch_with_retries, key, lat, long, date, retries)
+            _inflight[key] = future
+            created = True
+        else:
+            created = False
+    inc("weather_cache_lookups_total", result="miss" if created else "inflight")
+    if created:
+        future.add_done_callback(lambda f: _forget_inflight(key, f))
+    return future
+
+
+@register_collector
+def _weather_metrics():
+    with _inflight_lock:
+        inflight = len(_inflight)
+    return [("weather_cache_entries", {}, weather_cache.stats().get("size", 0)),
+            ("weather_fetches_inflight", {}, inflight)]
+
+
+def _forget_inflight(key, future):
+    with _inflight_lock:
+        if _inflight.get(key) is future:
+            del _inflight[key]
+
+
+def get_todays_forecast(lat, long, date, retries=3):
+    return submit_forecast(lat, long, date, retries).result()
+
+
+def _combine(origin, dest):
+    if origin is None or dest is None:
+        return None
+    features = {}
+    for k, v in origin.items():
+        features[f"origin_{k}"] = v
+    for k, v in dest.items():
+        features[f"dest_{k}"] = v
+    return features
+
+
+def get_weather_features_for_user_input(lat_o, lon_o, lat_d, lon_d, date_str):
+    # Both endpoints are fetched at the same time
+    origin = submit_forecast(lat_o, lon_o, date_str)
+    dest = submit_forecast(lat_d, lon_d, date_str)
+    return _combine(origin.result(), dest.result())
+
+
+async def get_weather_features_async(lat_o, lon_o, lat_d, lon_d, date_str):
+    """Awaitable version for async handlers; waits without blocking the loop."""
+    loop = asyncio.get_running_loop()
+    # The cache lookups are blocking reads, so they run on the loop's executor
+    futures = await loop.run_in_executor(
+        None, lambda: [submit_forecast(lat_o, lon_o, date_str), submit_forecast(lat_d, lon_d, date_str)]
+    )
+    # A coalesced Future is shared with other requests: shield it so that
+    # one cancelled caller does not cancel the fetch for everyone waiting
+    origin, dest = await asyncio.gather(*(asyncio.shield(asyncio.wrap_future(f)) for f in futures))
+    return _combine(origin, dest)